@@ -0,0 +1,35 @@
+"""基于规范化URL的分布式去重过滤器"""
+import hashlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from scrapy_redis.dupefilter import RFPDupeFilter
+
+# 各平台请求中每次随机生成、不影响页面内容的参数
+RANDOM_QUERY_PARAMS = frozenset(['t', 'req_id', 'source', 'anti_content', 'nonce'])
+
+
+def canonicalize_url(url, drop_params=RANDOM_QUERY_PARAMS):
+    """规范化URL：小写协议和主机、去除锚点和随机参数、查询参数排序"""
+    parts = urlsplit(url)
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in drop_params
+    )
+    return urlunsplit((
+        parts.scheme.lower(),
+        parts.netloc.lower(),
+        parts.path,
+        urlencode(query),
+        ''
+    ))
+
+
+class CanonicalRFPDupeFilter(RFPDupeFilter):
+    """优先使用request.meta['dupefilter_key']计算指纹的Redis去重过滤器
+
+    请求未设置该键时退化为scrapy-redis默认的请求指纹。
+    """
+    def request_fingerprint(self, request):
+        key = request.meta.get('dupefilter_key')
+        if not key:
+            return super().request_fingerprint(request)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
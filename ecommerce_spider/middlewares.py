@@ -2,6 +2,7 @@ import time
 import random
 import logging
 from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 from scrapy.downloadermiddlewares.useragent import UserAgentMiddleware
 from scrapy.downloadermiddlewares.httpproxy import HttpProxyMiddleware
 from selenium import webdriver
@@ -12,7 +13,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException, WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
-from scrapy.http import HtmlResponse
+from scrapy.http import HtmlResponse, Request
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +68,56 @@ class UserAgentMiddleware:
         request.headers['User-Agent'] = ua
         return None
 
+class RequestDelayMiddleware:
+    """按request.meta['download_delay']延迟调度单个请求（爬虫中间件）
+
+    回调/errback产出的请求带download_delay时先不交给引擎，由reactor定时器在延迟到期后
+    再调用engine.crawl入队。等待发生在调度之前，不占用下载并发槽位，
+    长时间的退避重试不会挤占其他请求（替代回调中的time.sleep）。
+    """
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self._pending = set()  # 尚未到期的定时器，爬虫关闭时取消
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_spider_output(self, response, result, spider):
+        for r in result:
+            if isinstance(r, Request):
+                delay = r.meta.pop('download_delay', None)
+                if delay and delay > 0:
+                    self._crawl_later(r, delay)
+                    continue
+            yield r
+
+    def _crawl_later(self, request, delay):
+        from twisted.internet import reactor
+
+        def crawl():
+            self._pending.discard(call)
+            self.crawler.engine.crawl(request)
+
+        call = reactor.callLater(delay, crawl)
+        self._pending.add(call)
+
+    def spider_idle(self, spider):
+        # 仍有延迟请求待入队时不视为空闲，避免调度队列暂时为空导致爬虫提前关闭
+        if self._pending:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        for call in self._pending:
+            if call.active():
+                call.cancel()
+        if self._pending:
+            logger.info(f"爬虫关闭，取消 {len(self._pending)} 个待调度的延迟请求")
+        self._pending.clear()
+
 class ProxyMiddleware:
     """代理中间件"""
     def __init__(self, settings):
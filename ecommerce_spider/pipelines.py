@@ -134,6 +134,11 @@ class SQLitePipeline:
         self.db_helper.create_tables(self.table_schemas)
         logger.info("SQLite数据库管道初始化完成")
 
+    def close_spider(self, spider):
+        """关闭数据库连接"""
+        if self.db_helper:
+            self.db_helper.close()
+
     def process_item(self, item, spider):
         """将item写入数据库"""
         adapter = ItemAdapter(item)
@@ -27,7 +27,7 @@ DOWNLOAD_DELAY = config['download_delay']
 
 # 分布式配置
 SCHEDULER = "scrapy_redis.scheduler.Scheduler"
-DUPEFILTER_CLASS = "scrapy_redis.dupefilter.RFPDupeFilter"
+DUPEFILTER_CLASS = "ecommerce_spider.dupefilters.CanonicalRFPDupeFilter"  # 支持规范化去重键
 SCHEDULER_PERSIST = True
 SCHEDULER_QUEUE_CLASS = 'scrapy_redis.queue.PriorityQueue'
 
@@ -37,6 +37,11 @@ REDIS_URL = f"redis://{redis_config.get('host', 'localhost')}:{redis_config.get(
 if redis_config.get('password'):
     REDIS_URL = f"redis://:{redis_config['password']}@{redis_config['host']}:{redis_config['port']}/{redis_config.get('db', 0)}"
 
+# 爬虫中间件
+SPIDER_MIDDLEWARES = {
+    'ecommerce_spider.middlewares.RequestDelayMiddleware': 40,  # 单请求延迟调度（在其他中间件处理输出之后）
+}
+
 # 下载中间件（优先级优化）
 DOWNLOADER_MIDDLEWARES = {
     'ecommerce_spider.middlewares.UserAgentMiddleware': 540,  # UA优先设置
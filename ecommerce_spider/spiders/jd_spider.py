@@ -7,6 +7,7 @@ from urllib.parse import urlparse, parse_qs, quote
 from datetime import datetime, timedelta
 
 import scrapy
+from scrapy import signals
 from scrapy_redis.spiders import RedisSpider
 from scrapy.utils.project import get_project_settings
 
@@ -114,6 +115,12 @@ class JDSpider(RedisSpider):
             self.logger.warning(f"加载Cookie失败: {e}")
             return []
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.monitor.close, signal=signals.spider_closed)
+        return spider
+
     def _register_worker(self):
         """注册Worker节点并启动健康检查"""
         self.monitor.register_worker(self.worker_id)
@@ -126,10 +133,7 @@ class JDSpider(RedisSpider):
         def check():
             while True:
                 # 更新Worker活动时间
-                self.monitor.redis_conn.set(
-                    f"worker:{self.worker_id}:last_active",
-                    datetime.now().timestamp()
-                )
+                self.monitor.heartbeat(self.worker_id)
                 
                 # 定期切换代理（京东代理失效较快，3分钟切换）
                 if time.time() - self.last_proxy_switch_time > 180:
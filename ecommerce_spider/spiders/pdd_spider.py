@@ -3,16 +3,145 @@ import json
 import random
 import hashlib
 import re
+import zlib
+import queue
+import secrets
+import threading
+from collections import Counter, deque
 from urllib.parse import quote, urlparse, parse_qs
 from datetime import datetime, timedelta
+import orjson
 import scrapy
+from scrapy import signals
 from scrapy_redis.spiders import RedisSpider
 from scrapy.utils.project import get_project_settings
+from scrapy.downloadermiddlewares.retry import get_retry_request
+from parsel.csstranslator import HTMLTranslator
+from pybloom_live import ScalableBloomFilter
 from ecommerce_spider.items import ProductItem, CommentItem, ShopItem
+from ecommerce_spider.dupefilters import canonicalize_url
 from utils.anti_crawler import AntiCrawler
 from utils.monitor import SpiderMonitor
 from utils.proxy_pool import ProxyPool  # 新增代理池工具
 
+_TRANSLATOR = HTMLTranslator()
+
+
+# 评论解析热循环中使用的预编译正则
+_DIGIT_RE = re.compile(r'(\d+)')
+_JSONP_RE = re.compile(rb'^jsonp\d+\(')
+
+# 搜索页数据中商品列表的候选路径
+_GOODS_LIST_PATHS = (
+    ('props', 'pageProps', 'search', 'goods'),
+    ('goodsList',),
+    ('data', 'goodsList'),
+    ('searchResult', 'goods'),
+    ('props', 'goodsList')
+)
+# 商品详情数据中原价的候选路径
+_ORIGINAL_PRICE_PATHS = (
+    ('goods', 'goods_detail', 'original_price'),
+    ('goodsDetail', 'originalPrice'),
+    ('priceInfo', 'originalPrice'),
+    ('data', 'originalPrice')
+)
+# 评论接口响应中评论列表及“是否有下一页”标记的候选路径（预先拆分为键元组）
+_COMMENT_PATHS = (
+    ('data', 'comments'),
+    ('comments',),
+    ('data', 'items'),
+    ('result', 'comments')
+)
+_MORE_PATHS = (
+    ('data', 'has_more'),
+    ('has_more',),
+    ('data', 'hasMore'),
+    ('result', 'has_more')
+)
+
+
+def _walk(obj, keys):
+    """沿键路径逐层取值，任一层缺失时返回None"""
+    for key in keys:
+        if not isinstance(obj, dict):
+            return None
+        obj = obj.get(key)
+        if obj is None:
+            return None
+    return obj
+
+
+# 评论各字段的候选键（按优先级排列，取第一个非空值）
+_COMMENT_ID_KEYS = ('comment_id', 'id', 'commentId')
+_USER_ID_KEYS = ('user_id', 'buyer_id', 'userId')
+_USER_NAME_KEYS = ('user_name', 'buyer_name', 'userName')
+_CONTENT_KEYS = ('content', 'comment', 'contentText')
+_RATING_KEYS = ('rating', 'score', 'star')
+_COMMENT_TIME_KEYS = ('comment_time', 'create_time', 'time')
+_USEFUL_VOTES_KEYS = ('useful_votes', 'like_count', 'useful')
+_REPLY_COUNT_KEYS = ('reply_count', 'replyNum')
+
+
+def _first(obj, keys, default=''):
+    """按顺序返回字典中第一个非空字段值"""
+    for key in keys:
+        value = obj.get(key)
+        if value:
+            return value
+    return default
+
+
+# 快速路径无法识别时依次尝试的评论时间格式
+_COMMENT_TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%m-%d %H:%M')
+
+
+def _normalize_comment_time(value):
+    """评论时间统一为'YYYY-mm-dd HH:MM:SS'，无法识别时原样返回
+
+    先按时间戳和常见定长格式直接拆分字段，只有其他格式才回退到逐个strptime尝试。
+    """
+    # 处理时间戳（10位秒级或13位毫秒级），数值类型无需先转字符串
+    if isinstance(value, (int, float)):
+        ts = int(value)
+    elif isinstance(value, str) and value.isdigit():
+        ts = int(value)
+    else:
+        ts = None
+    if ts is not None:
+        if ts >= 1e9:
+            if ts >= 1e10:
+                ts //= 1000
+            try:
+                return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
+            except (OverflowError, OSError, ValueError):
+                pass
+        return value
+    text = value if isinstance(value, str) else str(value)
+    try:
+        if len(text) == 19 and text[4] == '-' and text[7] == '-' and text[10] == ' ':
+            datetime(int(text[:4]), int(text[5:7]), int(text[8:10]),
+                     int(text[11:13]), int(text[14:16]), int(text[17:19]))
+            return text
+        if len(text) == 10 and text[4] == '-' and text[7] == '-':
+            datetime(int(text[:4]), int(text[5:7]), int(text[8:10]))
+            return f"{text} 00:00:00"
+    except ValueError:
+        pass
+    # 处理其他时间格式
+    for fmt in _COMMENT_TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            continue
+    return value
+
+
+def _xpath(css):
+    """将CSS选择器预编译为XPath（类定义时执行一次）"""
+    return _TRANSLATOR.css_to_xpath(css)
+
+
 class PDDSpider(RedisSpider):
     """拼多多分布式爬虫"""
     name = "pdd"
@@ -40,6 +169,74 @@ class PDDSpider(RedisSpider):
         'RANDOMIZE_DOWNLOAD_DELAY': True,
     }
 
+    # 请求头静态部分（会话ID、设备ID、UA按请求填充）
+    _BASE_HEADERS = {
+        'Referer': 'https://mobile.yangkeduo.com/',
+        'X-Requested-With': 'XMLHttpRequest',
+        'PDD-User-ID': '',
+        'Accept': 'application/json, text/javascript, */*; q=0.01',
+        'Accept-Language': 'zh-CN,zh;q=0.9',
+        'Connection': 'keep-alive',
+        'Cache-Control': 'no-cache',
+    }
+    # 可选请求头（值为None表示每次动态生成）
+    _OPTIONAL_HEADERS = (
+        ('Accept-Encoding', 'gzip, deflate, br'),
+        ('Origin', 'https://mobile.yangkeduo.com'),
+        ('X-Forwarded-For', None),
+        ('DNT', '1'),  # 防追踪标识
+        ('Upgrade-Insecure-Requests', '1'),
+    )
+    # 选中2-4个可选头的全部位掩码
+    _OPTIONAL_MASKS = tuple(
+        m for m in range(1 << len(_OPTIONAL_HEADERS)) if 2 <= bin(m).count('1') <= 4
+    )
+
+    # 403/429指数退避的基础延迟表（秒），按重试次数索引
+    _RETRY_BACKOFFS = tuple(2 ** i for i in range(custom_settings['RETRY_TIMES'] + 1))
+    _HOT_PROXY_TARGET = 16  # 预取代理数量上限（另受代理池大小限制）
+
+    # 评论接口URL变体（随机选用，翻页时沿用同一模板）
+    _COMMENT_URL_TEMPLATES = (
+        "https://mobile.yangkeduo.com/proxy/api/comments/list?goods_id={goods_id}&page={page}&size=20",
+        "https://apiv2.yangkeduo.com/api/turing/v2/comments/list?goods_id={goods_id}&page={page}&size=20",
+        "https://pddapi.com/api/v1/comments/goods?goods_id={goods_id}&page={page}&limit=20",
+        "https://mobile.yangkeduo.com/proxy/api/v2/comments/list?goods_id={goods_id}&page={page}&size=20"
+    )
+
+    # anti_content签名密钥
+    _ANTI_CONTENT_KEY = hashlib.sha256(b'pdd_salt_constant').digest()
+
+    # 预编译选择器（避免每次解析页面时重复做CSS到XPath的转换）
+    _SEARCH_SCRIPT_XPATHS = tuple(_xpath(css) for css in (
+        'script:contains("window.rawData")',
+        'script:contains("initialState")',
+        'script:contains("goodsListData")',
+        'script[type="application/json"]'
+    ))
+    _PRICE_XPATHS = tuple(_xpath(css) for css in (
+        'script:contains("initialData")',
+        'script:contains("goodsDetail")',
+        'script:contains("priceInfo")',
+        'div.price-container::text'
+    ))
+    _COMMENT_COUNT_XPATHS = tuple(_xpath(css) for css in (
+        '.comment-count::text',
+        '.comment-total::text',
+        'span:contains("评价")::text',
+        'script:contains("commentCount")'
+    ))
+    _SHOP_LINK_XPATH = _xpath('a[href*="mall_id"]::attr(href)')
+    _MALL_SCRIPT_XPATH = _xpath('script:contains("mall_id")::text')
+    _SHOP_SCORE_XPATHS = {key: _xpath(css) for key, css in {
+        'score_service': '.service-score::text',
+        'score_delivery': '.delivery-score::text',
+        'score_description': '.description-score::text'
+    }.items()}
+    _SHOP_TYPE_XPATH = _xpath('.shop-type::text')
+    _LOCATION_XPATH = _xpath('.location::text')
+    _OPEN_TIME_XPATH = _xpath('.open-time::text')
+
     def __init__(self, role='worker', *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.role = role
@@ -54,11 +251,24 @@ class PDDSpider(RedisSpider):
         self.session_id = self._generate_session_id()
         self.device_id = self._generate_device_id()
         self.anti_content_version = 'v2'
+        self._anti_cache = {}  # 当前秒内已生成的anti_content: {(keyword, page, device_id): token}
+        self._anti_cache_time = 0
+        self._cached_headers = None  # 当前会话的请求头（Request会复制一份，可安全复用）
+        self._headers_session = None
+        self._ts_cache = (0, '')  # 当前秒的格式化时间: (秒级时间戳, 'YYYY-mm-dd HH:MM:SS')
         self.task_counter = 0
-        self.error_history = []  # 错误历史记录，用于动态调整策略
+        self.error_history = deque(maxlen=100)  # 最近100条错误记录，用于动态调整策略
+        self.error_counts = Counter()  # 按错误类型累计的总次数（不受error_history长度限制）
         self.last_proxy_switch_time = time.time()
         self.proxy = None  # 当前使用的代理
+        # 预取的可用代理与待上报的失败代理，由后台线程维护，解析回调中只做出入队
+        self._hot_proxies = deque(maxlen=self._HOT_PROXY_TARGET)
+        self._proxy_failures = queue.SimpleQueue()
+        self._proxy_refill = threading.Event()
+        threading.Thread(target=self._proxy_loop, daemon=True).start()
         self.user_agent_rotation = self._load_user_agents()  # 加载UA池
+        # 本地布隆过滤器：Redis去重前的一级过滤，避免重复调度详情/店铺任务
+        self.seen_filter = ScalableBloomFilter(initial_capacity=1000000, error_rate=1e-4)
 
     def _load_user_agents(self):
         """从文件加载用户代理池（移动端优先）"""
@@ -74,6 +284,12 @@ class PDDSpider(RedisSpider):
             self.logger.warning(f"加载用户代理失败: {e}，使用默认UA")
             return [self.anti_crawler.get_random_ua(mobile=True)]
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.monitor.close, signal=signals.spider_closed)
+        return spider
+
     def _register_worker(self):
         self.monitor.register_worker(self.worker_id)
         self.logger.info(f"PDD Worker节点注册: {self.worker_id}")
@@ -82,34 +298,111 @@ class PDDSpider(RedisSpider):
 
     def _start_health_check(self):
         """启动工作节点健康检查线程"""
-        from threading import Thread
         def check():
             while True:
                 # 每30秒更新一次活动时间
-                self.monitor.redis_conn.set(
-                    f"worker:{self.worker_id}:last_active", 
-                    datetime.now().timestamp()
-                )
-                # 每5分钟检查一次代理健康
-                if time.time() - self.last_proxy_switch_time > 300:
+                self.monitor.heartbeat(self.worker_id)
+                # 仅在没有可用代理时每5分钟补取一次；健康代理保持不变，
+                # 以便下载器的HTTP/1.1连接池复用到同一代理的长连接（失败时由_switch_proxy更换）
+                if self.proxy is None and time.time() - self.last_proxy_switch_time > 300:
                     self.proxy = self.proxy_pool.get_working_proxy()
                     self.last_proxy_switch_time = time.time()
                 time.sleep(30)
         
-        Thread(target=check, daemon=True).start()
+        threading.Thread(target=check, daemon=True).start()
+
+    def _proxy_loop(self):
+        """后台线程：上报失败代理并预取可用代理，避免在reactor线程操作代理池
+
+        预取队列中的代理互不重复，数量不超过代理池大小（当前代理也计入）；
+        只预取熔断器关闭的代理，不占用半开探测名额。代理池取不到代理时按指数退避重试。
+        """
+        backoff = 1
+        retry_at = 0
+        while True:
+            self._proxy_refill.wait(1)
+            self._proxy_refill.clear()
+            while True:
+                try:
+                    failed = self._proxy_failures.get_nowait()
+                except queue.Empty:
+                    break
+                self.proxy_pool.report_failure(failed)
+            if time.time() < retry_at:
+                continue
+            held = set(self._hot_proxies)
+            current = self.proxy
+            if current:
+                held.add(current)
+            target = min(self._HOT_PROXY_TARGET, self.proxy_pool.size() - (1 if current else 0))
+            exhausted = False
+            while len(self._hot_proxies) < target:
+                proxy = self.proxy_pool.get_working_proxy(exclude=held, allow_probe=False)
+                if not proxy:
+                    exhausted = True
+                    break
+                held.add(proxy)
+                self._hot_proxies.append(proxy)
+            if self.proxy is None and self._hot_proxies:
+                # 此前因无可用代理退回本地IP，补充到代理后立即切回
+                try:
+                    self.proxy = self._hot_proxies.popleft()
+                    self.last_proxy_switch_time = time.time()
+                except IndexError:
+                    pass
+            if exhausted:
+                # 没有可预取的代理（池空或均在熔断），退避后再试，避免每秒重复取用和告警
+                retry_at = time.time() + backoff
+                backoff = min(backoff * 2, 60)
+            else:
+                backoff = 1
+
+    def _switch_proxy(self, failed_proxy=None):
+        """切换代理：失败上报交给后台线程，从预取队列中取下一个仍可用的代理；无可用代理时不再沿用失败代理"""
+        if failed_proxy:
+            self._proxy_failures.put(failed_proxy)
+        while self._hot_proxies:
+            proxy = self._hot_proxies.popleft()
+            if proxy != failed_proxy and self.proxy_pool.is_usable(proxy):
+                self.proxy = proxy
+                self.last_proxy_switch_time = time.time()
+                break
+        else:
+            if failed_proxy and self.proxy == failed_proxy:
+                self.proxy = None  # 预取队列为空，暂用本地IP，由后台线程补充
+        self._proxy_refill.set()
 
     def _generate_session_id(self):
         """生成会话ID（模拟APP会话）"""
         base = f"pdd_{int(time.time())}_{random.getrandbits(32)}_android"
         return hashlib.md5(base.encode()).hexdigest()
 
+    def _record_error(self, error_type, message, **extra):
+        """记录一次错误：追加到最近错误记录并累加该类型的总次数"""
+        self.error_history.append({
+            'time': datetime.now(),
+            'type': error_type,
+            'message': message,
+            **extra
+        })
+        self.error_counts[error_type] += 1
+
+    def _now_str(self):
+        """当前时间字符串，同一秒内复用格式化结果"""
+        now = int(time.time())
+        cache = self._ts_cache
+        if cache[0] != now:
+            cache = (now, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)))
+            self._ts_cache = cache
+        return cache[1]
+
     def _generate_device_id(self):
         """设备ID（模拟真实设备指纹）"""
         manufacturers = ['xiaomi', 'huawei', 'oppo', 'vivo', 'apple']
         models = ['mi11', 'p50', 'reno6', 'x70', 'iphone13']
         manufacturer = random.choice(manufacturers)
         model = random.choice(models)
-        serial = ''.join(random.sample('0123456789ABCDEF', 16))
+        serial = secrets.token_hex(8).upper()
         return f"{manufacturer}-{model}-{serial}"
 
     def start_requests(self):
@@ -153,6 +446,8 @@ class PDDSpider(RedisSpider):
         """构建搜索请求（增强反爬参数）"""
         anti_content = self.generate_anti_content(keyword, page)
         url = f"https://mobile.yangkeduo.com/search_result.html?search_key={quote(keyword)}&page={page}&anti_content={anti_content}"
+        # 去重键基于随机化前的规范URL，保证同一(关键词, 页码)指纹一致
+        dupefilter_key = canonicalize_url(url)
         
         # 随机选择不同的搜索路径，增加随机性
         path_choices = [
@@ -182,59 +477,61 @@ class PDDSpider(RedisSpider):
                 'render_js': True,
                 'retry_times': 0,
                 'proxy': self.proxy,  # 绑定当前代理
-                'start_time': time.time()  # 记录开始时间用于超时判断
+                'start_time': time.time(),  # 记录开始时间用于超时判断
+                'dupefilter_key': dupefilter_key
             },
             headers=self._get_headers(),
-            errback=self.handle_error,
-            dont_filter=True
+            errback=self.handle_error
         )
 
     def _get_headers(self):
         """生成更真实的请求头（动态调整策略）"""
-        # 基础 headers
-        headers = {
-            'Referer': 'https://mobile.yangkeduo.com/',
-            'X-Requested-With': 'XMLHttpRequest',
-            'PDD-User-ID': '',
-            'PDD-Session-ID': self.session_id,
-            'PDD-Device-ID': self.device_id,
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Accept-Language': 'zh-CN,zh;q=0.9',
-            'Connection': 'keep-alive',
-            'Cache-Control': 'no-cache',
-            'User-Agent': random.choice(self.user_agent_rotation)  # 从UA池随机选择
-        }
-
         # 动态调整策略：每处理8个任务更换会话ID（比原来更频繁）
         if self.task_counter % 8 == 0 and self.task_counter > 0:
             self.session_id = self._generate_session_id()
-            headers['PDD-Session-ID'] = self.session_id
             # 同时更换设备ID
             if random.random() > 0.3:
                 self.device_id = self._generate_device_id()
-                headers['PDD-Device-ID'] = self.device_id
-        
+
         self.task_counter += 1
-        
-        # 随机增加可选头，增强真实性
-        optional_headers = {
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Origin': 'https://mobile.yangkeduo.com',
-            'X-Forwarded-For': self.anti_crawler.get_random_ip(),
-            'DNT': '1',  # 防追踪标识
-            'Upgrade-Insecure-Requests': '1'
-        }
-        # 随机选择2-4个可选头
-        selected_headers = random.sample(list(optional_headers.items()), random.randint(2, 4))
-        for k, v in selected_headers:
-            headers[k] = v
-            
+
+        # 同一会话/设备复用同一份请求头，会话或设备变化时才重新生成
+        session_key = (self.session_id, self.device_id)
+        if self._headers_session == session_key:
+            return self._cached_headers
+
+        # 基础 headers（静态部分复用类常量）
+        headers = self._BASE_HEADERS.copy()
+        headers['PDD-Session-ID'] = self.session_id
+        headers['PDD-Device-ID'] = self.device_id
+        headers['User-Agent'] = random.choice(self.user_agent_rotation)  # 从UA池随机选择
+
+        # 随机增加2-4个可选头，增强真实性（按预计算的位掩码选择）
+        mask = random.choice(self._OPTIONAL_MASKS)
+        for i, (k, v) in enumerate(self._OPTIONAL_HEADERS):
+            if mask >> i & 1:
+                headers[k] = v if v is not None else self.anti_crawler.get_random_ip()
+
+        self._cached_headers = headers
+        self._headers_session = session_key
         return headers
 
     def generate_anti_content(self, keyword, page):
-        """增强版anti_content生成（更接近真实加密逻辑）"""
+        """增强版anti_content生成（更接近真实加密逻辑）
+
+        同一秒内相同(关键词, 页码, 设备)复用已生成的token，服务端允许小范围时间窗口。
+        """
+        now = int(time.time())
+        if now != self._anti_cache_time:
+            self._anti_cache.clear()
+            self._anti_cache_time = now
+        cache_key = (keyword, page, self.device_id)
+        cached = self._anti_cache.get(cache_key)
+        if cached:
+            return cached
+
         timestamp = int(time.time() * 1000)
-        nonce = ''.join(random.sample('0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ', 16))  # 更长更复杂
+        nonce = secrets.token_urlsafe(12)  # 16位URL安全随机串（允许字符重复）
         app_version = random.choice(['6.34.0', '6.35.1', '6.36.2'])  # 模拟不同APP版本
         channel = random.choice(['appstore', 'huawei', 'xiaomi', 'oppo'])  # 模拟不同渠道
         
@@ -246,13 +543,16 @@ class PDDSpider(RedisSpider):
             f"&os={random.choice(['android_12', 'android_13', 'ios_16'])}"
         )
         
-        # 多层加密模拟
-        salt1 = hashlib.md5(str(timestamp % 3600).encode()).hexdigest()[:8]
-        temp = hashlib.sha1((data + salt1).encode()).hexdigest()
-        salt2 = 'pdd_' + hashlib.md5(app_version.encode()).hexdigest()[:6]
-        sign = hashlib.md5((temp + salt2).encode()).hexdigest()
+        # 单次带密钥哈希签名（版本号已包含在data中），输出长度与原md5签名一致
+        sign = hashlib.blake2b(
+            f"{data}&salt={timestamp % 3600}".encode(),
+            key=self._ANTI_CONTENT_KEY,
+            digest_size=16
+        ).hexdigest()
         
-        return f"{sign}_{timestamp}_{nonce}_{self.anti_content_version}_{channel}"
+        anti_content = f"{sign}_{timestamp}_{nonce}_{self.anti_content_version}_{channel}"
+        self._anti_cache[cache_key] = anti_content
+        return anti_content
 
     def parse_search(self, response):
         """解析搜索结果并生成商品任务（增强错误处理）"""
@@ -260,8 +560,7 @@ class PDDSpider(RedisSpider):
         request_time = time.time() - response.meta['start_time']
         if request_time > 15:  # 超过15秒视为异常
             self.logger.warning(f"请求耗时过长: {request_time}s，更换代理")
-            self.proxy_pool.report_failure(response.meta.get('proxy'))
-            self.proxy = self.proxy_pool.get_working_proxy()
+            self._switch_proxy(response.meta.get('proxy'))
 
         self.monitor.update_request_stats(success=True)
         keyword = response.meta['keyword']
@@ -270,20 +569,14 @@ class PDDSpider(RedisSpider):
         try:
             # 多路径提取商品数据脚本
             product_script = None
-            script_selectors = [
-                'script:contains(window.rawData)',
-                'script:contains(initialState)',
-                'script:contains(goodsListData)',
-                'script[type="application/json"]'
-            ]
-            for selector in script_selectors:
-                product_script = response.css(selector).get()
+            for xpath in self._SEARCH_SCRIPT_XPATHS:
+                product_script = response.xpath(xpath).get()
                 if product_script:
                     break
             
             if not product_script:
                 self.logger.warning(f"未找到商品数据，重试页面 {current_page}")
-                self._handle_parse_failure(response, "未找到商品数据脚本")
+                yield from self._handle_parse_failure(response, "未找到商品数据脚本")
                 return
             
             # 解析JSON数据（增强容错）
@@ -301,27 +594,14 @@ class PDDSpider(RedisSpider):
                 raw_data = re.sub(r'inf', '1000000', raw_data)
                 data = json.loads(raw_data)
             except (json.JSONDecodeError, ValueError) as e:
-                self.logger.error(f"解析数据失败: {e}，尝试备用解析方式")
-                self._handle_parse_failure(response, f"数据解析错误: {str(e)}")
+                self.logger.error("解析数据失败: %s，尝试备用解析方式", e)
+                yield from self._handle_parse_failure(response, f"数据解析错误: {str(e)}")
                 return
             
             # 多路径提取商品列表
             products = []
-            data_paths = [
-                'props.pageProps.search.goods',
-                'goodsList',
-                'data.goodsList',
-                'searchResult.goods',
-                'props.goodsList'
-            ]
-            for path in data_paths:
-                current = data
-                for key in path.split('.'):
-                    if isinstance(current, dict) and key in current:
-                        current = current[key]
-                    else:
-                        current = None
-                        break
+            for path in _GOODS_LIST_PATHS:
+                current = _walk(data, path)
                 if current and isinstance(current, list):
                     products = current
                     break
@@ -331,12 +611,18 @@ class PDDSpider(RedisSpider):
                 # 检查是否被反爬拦截
                 if '验证' in response.text or '安全' in response.text or '请登录' in response.text:
                     self.logger.warning("检测到反爬拦截，强制更换代理和会话")
-                    self.proxy_pool.report_failure(response.meta.get('proxy'))
-                    self.proxy = self.proxy_pool.get_working_proxy()
+                    self._switch_proxy(response.meta.get('proxy'))
                     self.session_id = self._generate_session_id()
                 return
             
-            # 处理商品数据
+            # 根据错误历史调整详情页爬取概率（错误率高则降低，整页计算一次）
+            error_rate = len(self.error_history) / max(self.task_counter, 1)
+            crawl_prob = 0.8 - min(error_rate * 2, 0.5)
+
+            # 先收集整页的商品与详情页请求，循环结束后统一产出
+            items = []
+            requests = []
+            detail_delay = 0.0  # 详情请求的累计延迟，逐个错开发送（由RequestDelayMiddleware调度，不阻塞reactor）
             for product in products:
                 item = ProductItem()
                 item['platform'] = 'pdd'
@@ -367,7 +653,8 @@ class PDDSpider(RedisSpider):
                             prices.append(str(product[main_key]).strip())
                 
                 if prices:
-                    unique_prices = list(filter(None, list(set(prices))))
+                    # 保序去重，保证区间价格的先后顺序稳定
+                    unique_prices = [p for p in dict.fromkeys(prices) if p]
                     if len(unique_prices) >= 2:
                         item['price'] = f"{unique_prices[0]}-{unique_prices[1]}"
                     else:
@@ -388,21 +675,18 @@ class PDDSpider(RedisSpider):
                 item['shop_name'] = product.get('mall_name', '').strip() or product.get('shop_name', '').strip()
                 item['url'] = f"https://mobile.yangkeduo.com/goods.html?goods_id={goods_id}"
                 item['category'] = keyword
-                item['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                item['crawl_time'] = self._now_str()
                 
                 self.monitor.update_item_stats('product')
-                yield item
+                items.append(item)
                 
-                # 跟进商品详情页（动态调整概率）
-                if goods_id:
-                    # 根据错误历史调整爬取概率
-                    error_rate = len(self.error_history) / max(self.task_counter, 1)
-                    crawl_prob = 0.8 - min(error_rate * 2, 0.5)  # 错误率高则降低爬取概率
-                    
+                # 跟进商品详情页（动态调整概率，本地布隆过滤器跳过已调度的商品）
+                if goods_id and f"goods:{goods_id}" not in self.seen_filter:
                     if random.random() < crawl_prob:
-                        # 随机延迟，模拟人类浏览
-                        time.sleep(random.uniform(0.3, 1.2))
-                        yield scrapy.Request(
+                        self.seen_filter.add(f"goods:{goods_id}")
+                        # 随机间隔，模拟人类浏览
+                        detail_delay += random.uniform(0.3, 1.2)
+                        requests.append(scrapy.Request(
                             item['url'],
                             callback=self.parse_product,
                             meta={
@@ -411,12 +695,16 @@ class PDDSpider(RedisSpider):
                                 'goods_id': goods_id, 
                                 'task_type': 'product',
                                 'proxy': self.proxy,
-                                'start_time': time.time()
+                                'start_time': time.time() + detail_delay,  # 耗时从延迟结束、实际发出时算起
+                                'download_delay': detail_delay
                             },
                             headers=self._get_headers(),
                             priority=2,
                             errback=self.handle_error
-                        )
+                        ))
+
+            yield from items
+            yield from requests
             
             # 处理分页（智能调整）
             if current_page < self.max_pages:
@@ -426,59 +714,56 @@ class PDDSpider(RedisSpider):
                 next_page_prob = 0.7 + min(page_quality - 0.5, 0.3)  # 质量高则提高概率
                 
                 if random.random() < next_page_prob:
-                    # 随机延迟后再生成下一页任务
-                    time.sleep(random.uniform(0.5, 1.5))
-                    yield self._build_search_request(keyword, next_page)
+                    # 随机延迟后再请求下一页（由RequestDelayMiddleware非阻塞等待）
+                    next_request = self._build_search_request(keyword, next_page)
+                    next_request.meta['download_delay'] = random.uniform(0.5, 1.5)
+                    next_request.meta['start_time'] += next_request.meta['download_delay']
+                    yield next_request
                 
         except Exception as e:
-            self.logger.error(f"解析搜索页错误: {e}", exc_info=True)
+            self.logger.error("解析搜索页错误: %s", e, exc_info=True)
             self.monitor.update_request_stats(success=False)
             self.monitor.log_error(str(e), self.name)
-            self.error_history.append({
-                'time': datetime.now(),
-                'type': 'search_parse',
-                'message': str(e)
-            })
-            # 限制错误历史长度
-            if len(self.error_history) > 100:
-                self.error_history.pop(0)
+            self._record_error('search_parse', str(e))
             
-            # 智能重试
-            retry_times = response.meta.get('retry_times', 0)
-            if retry_times < 3:
-                # 指数退避重试
-                retry_delay = (2 ** retry_times) + random.random()
-                self.logger.info(f"{retry_times+1}次重试页面 {current_page}，延迟 {retry_delay:.2f}s")
-                time.sleep(retry_delay)
-                yield self._build_search_request(
-                    keyword,
-                    current_page
-                ).replace(meta={** response.meta, 'retry_times': retry_times + 1})
+            # 交给Scrapy重试机制调度（重新生成签名，不阻塞reactor）
+            retry_request = get_retry_request(
+                self._rebuild_search_request(response),
+                spider=self,
+                reason='search_parse_error',
+                max_retry_times=3
+            )
+            if retry_request:
+                yield retry_request
+
+    def _rebuild_search_request(self, response):
+        """按失败响应的关键词和页码重新生成搜索请求，只沿用重试次数
+
+        新请求使用当前代理、新的签名和start_time，不继承失败请求的代理与计时。
+        """
+        request = self._build_search_request(response.meta['keyword'], response.meta['page'])
+        request.meta['retry_times'] = response.meta.get('retry_times', 0)
+        return request
 
     def _handle_parse_failure(self, response, reason):
         """统一处理解析失败逻辑"""
         self.monitor.update_request_stats(success=False)
         self.monitor.log_error(reason, self.name)
-        self.error_history.append({
-            'time': datetime.now(),
-            'type': 'parse_failure',
-            'message': reason
-        })
+        self._record_error('parse_failure', reason)
         
-        retry_times = response.meta.get('retry_times', 0)
-        if retry_times < 3:
-            # 更换代理后重试
-            self.proxy_pool.report_failure(response.meta.get('proxy'))
-            self.proxy = self.proxy_pool.get_working_proxy()
-            self.session_id = self._generate_session_id()  # 同时更换会话
-            self.logger.info(f"因{reason}，更换代理并重试第{retry_times+1}次")
-            yield self._build_search_request(
-                response.meta['keyword'],
-                response.meta['page']
-            ).replace(
-                meta={**response.meta, 'retry_times': retry_times + 1, 'proxy': self.proxy},
-                headers=self._get_headers()  # 使用新会话的headers
+        if response.meta.get('retry_times', 0) < 3:
+            # 更换代理和会话后重试
+            self._switch_proxy(response.meta.get('proxy'))
+            self.session_id = self._generate_session_id()
+            self.logger.info(f"因{reason}，更换代理和会话后重试")
+            retry_request = get_retry_request(
+                self._rebuild_search_request(response),
+                spider=self,
+                reason=reason,
+                max_retry_times=3
             )
+            if retry_request:
+                yield retry_request
 
     def parse_product(self, response):
         """解析商品详情页（增强信息提取和容错）"""
@@ -486,8 +771,7 @@ class PDDSpider(RedisSpider):
         request_time = time.time() - response.meta['start_time']
         if request_time > 15:
             self.logger.warning(f"商品详情请求耗时过长: {request_time}s，更换代理")
-            self.proxy_pool.report_failure(response.meta.get('proxy'))
-            self.proxy = self.proxy_pool.get_working_proxy()
+            self._switch_proxy(response.meta.get('proxy'))
 
         self.monitor.update_request_stats(success=True)
         item = response.meta['item']
@@ -496,14 +780,8 @@ class PDDSpider(RedisSpider):
         try:
             # 提取价格信息（多来源）
             price_info = None
-            price_selectors = [
-                'script:contains(initialData)',
-                'script:contains(goodsDetail)',
-                'script:contains(priceInfo)',
-                'div.price-container::text'
-            ]
-            for selector in price_selectors:
-                price_info = response.css(selector).get()
+            for xpath in self._PRICE_XPATHS:
+                price_info = response.xpath(xpath).get()
                 if price_info:
                     break
             
@@ -514,36 +792,18 @@ class PDDSpider(RedisSpider):
                     initial_data = json.loads(price_info[start:end].replace('undefined', 'null'))
                     
                     # 多路径提取原价
-                    original_price_paths = [
-                        'goods.goods_detail.original_price',
-                        'goodsDetail.originalPrice',
-                        'priceInfo.originalPrice',
-                        'data.originalPrice'
-                    ]
-                    for path in original_price_paths:
-                        current = initial_data
-                        for key in path.split('.'):
-                            if isinstance(current, dict) and key in current:
-                                current = current[key]
-                            else:
-                                current = None
-                                break
+                    for path in _ORIGINAL_PRICE_PATHS:
+                        current = _walk(initial_data, path)
                         if current:
                             item['original_price'] = str(current).strip()
                             break
                 except (json.JSONDecodeError, ValueError) as e:
-                    self.logger.error(f"解析价格信息失败: {e}")
+                    self.logger.error("解析价格信息失败: %s", e)
             
             # 提取评论数量（多来源）
             comment_count = None
-            comment_selectors = [
-                '.comment-count::text',
-                '.comment-total::text',
-                'span:contains(评价)::text',
-                'script:contains(commentCount)'
-            ]
-            for selector in comment_selectors:
-                comment_text = response.css(selector).get()
+            for xpath in self._COMMENT_COUNT_XPATHS:
+                comment_text = response.xpath(xpath).get()
                 if comment_text:
                     comment_count = re.search(r'(\d+)', comment_text)
                     if comment_count:
@@ -555,7 +815,7 @@ class PDDSpider(RedisSpider):
             # 提取店铺ID（增强版）
             shop_id = None
             # 从链接提取
-            shop_links = response.css('a[href*="mall_id"]::attr(href)').getall()
+            shop_links = response.xpath(self._SHOP_LINK_XPATH).getall()
             for link in shop_links:
                 parsed = urlparse(link)
                 shop_id = parse_qs(parsed.query).get('mall_id', [None])[0]
@@ -563,7 +823,7 @@ class PDDSpider(RedisSpider):
                     break
             # 从脚本提取
             if not shop_id:
-                shop_script = response.css('script:contains(mall_id)::text').get()
+                shop_script = response.xpath(self._MALL_SCRIPT_XPATH).get()
                 if shop_script:
                     match = re.search(r'mall_id\s*=\s*(\d+)', shop_script)
                     if match:
@@ -574,66 +834,61 @@ class PDDSpider(RedisSpider):
                 shop_item = ShopItem()
                 shop_item['shop_id'] = shop_id
                 shop_item['shop_name'] = item['shop_name']
-                shop_item['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                shop_item['crawl_time'] = self._now_str()
                 yield shop_item
                 
-                # 店铺评分任务
-                yield scrapy.Request(
-                    f"https://mobile.yangkeduo.com/mall_page.html?mall_id={shop_id}",
-                    callback=self.parse_shop_score,
-                    meta={
-                        'shop_item': shop_item, 
-                        'task_type': 'shop',
-                        'proxy': self.proxy,
-                        'start_time': time.time()
-                    },
-                    headers=self._get_headers(),
-                    priority=4,
-                    errback=self.handle_error
-                )
+                # 店铺评分任务（同一店铺只调度一次）
+                if f"mall:{shop_id}" not in self.seen_filter:
+                    self.seen_filter.add(f"mall:{shop_id}")
+                    yield scrapy.Request(
+                        f"https://mobile.yangkeduo.com/mall_page.html?mall_id={shop_id}",
+                        callback=self.parse_shop_score,
+                        meta={
+                            'shop_item': shop_item, 
+                            'task_type': 'shop',
+                            'proxy': self.proxy,
+                            'start_time': time.time()
+                        },
+                        headers=self._get_headers(),
+                        priority=4,
+                        errback=self.handle_error
+                    )
             
             # 生成评论任务
             if goods_id and comment_count and int(comment_count) > 0:
                 pages_needed = min(int(comment_count) // 20 + 1, self.max_comments // 20)
+                comment_delay = 0.0  # 评论页请求的累计延迟，逐页错开发送（不阻塞reactor）
                 for page in range(1, pages_needed + 1):
                     # 评论URL随机化，增加更多变体
-                    comment_urls = [
-                        f"https://mobile.yangkeduo.com/proxy/api/comments/list?goods_id={goods_id}&page={page}&size=20",
-                        f"https://apiv2.yangkeduo.com/api/turing/v2/comments/list?goods_id={goods_id}&page={page}&size=20",
-                        f"https://pddapi.com/api/v1/comments/goods?goods_id={goods_id}&page={page}&limit=20",
-                        f"https://mobile.yangkeduo.com/proxy/api/v2/comments/list?goods_id={goods_id}&page={page}&size=20"
-                    ]
-                    comment_url = random.choice(comment_urls)
+                    url_tpl = random.choice(self._COMMENT_URL_TEMPLATES)
                     
-                    # 随机延迟，模拟人类行为
-                    time.sleep(random.uniform(0.5, 1.5))
+                    # 随机间隔，模拟人类行为
+                    comment_delay += random.uniform(0.5, 1.5)
                     yield scrapy.Request(
-                        comment_url,
+                        url_tpl.format(goods_id=goods_id, page=page),
                         callback=self.parse_comments,
                         meta={
                             'item': item, 
                             'page': page, 
                             'goods_id': goods_id, 
+                            'url_tpl': url_tpl,
                             'task_type': 'comment',
                             'proxy': self.proxy,
-                            'start_time': time.time()
+                            'start_time': time.time() + comment_delay,  # 耗时从延迟结束、实际发出时算起
+                            'download_delay': comment_delay
                         },
                         headers=self._get_headers(),
                         priority=3,
                         errback=self.handle_error
                     )
             
-            item['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            item['crawl_time'] = self._now_str()
             yield item
             
         except Exception as e:
-            self.logger.error(f"解析商品页错误: {e}", exc_info=True)
+            self.logger.error("解析商品页错误: %s", e, exc_info=True)
             self.monitor.update_request_stats(success=False)
-            self.error_history.append({
-                'time': datetime.now(),
-                'type': 'product_parse',
-                'message': str(e)
-            })
+            self._record_error('product_parse', str(e))
             if 'item' in response.meta:
                 yield response.meta['item']
 
@@ -644,23 +899,18 @@ class PDDSpider(RedisSpider):
         
         try:
             # 提取店铺评分
-            score_selectors = {
-                'score_service': '.service-score::text',
-                'score_delivery': '.delivery-score::text',
-                'score_description': '.description-score::text'
-            }
-            for key, selector in score_selectors.items():
-                score_text = response.css(selector).get() or ''
+            for key, xpath in self._SHOP_SCORE_XPATHS.items():
+                score_text = response.xpath(xpath).get() or ''
                 score = re.search(r'(\d+\.\d+)', score_text)
                 if score:
                     shop_item[key] = score.group(1)
             
             # 提取店铺类型和位置
-            shop_item['shop_type'] = response.css('.shop-type::text').get(default='').strip()
-            shop_item['location'] = response.css('.location::text').get(default='').strip()
+            shop_item['shop_type'] = response.xpath(self._SHOP_TYPE_XPATH).get(default='').strip()
+            shop_item['location'] = response.xpath(self._LOCATION_XPATH).get(default='').strip()
             
             # 提取开店时间
-            open_time_text = response.css('.open-time::text').get(default='').strip()
+            open_time_text = response.xpath(self._OPEN_TIME_XPATH).get(default='').strip()
             match = re.search(r'(\d{4}-\d{2}-\d{2})', open_time_text)
             if match:
                 shop_item['registered_time'] = match.group(1)
@@ -668,7 +918,7 @@ class PDDSpider(RedisSpider):
             yield shop_item
             
         except Exception as e:
-            self.logger.error(f"解析店铺评分错误: {e}", exc_info=True)
+            self.logger.error("解析店铺评分错误: %s", e, exc_info=True)
             self.monitor.update_request_stats(success=False)
             yield shop_item
 
@@ -678,8 +928,7 @@ class PDDSpider(RedisSpider):
         request_time = time.time() - response.meta['start_time']
         if request_time > 15:
             self.logger.warning(f"评论请求耗时过长: {request_time}s，更换代理")
-            self.proxy_pool.report_failure(response.meta.get('proxy'))
-            self.proxy = self.proxy_pool.get_working_proxy()
+            self._switch_proxy(response.meta.get('proxy'))
 
         self.monitor.update_request_stats(success=True)
         try:
@@ -688,171 +937,138 @@ class PDDSpider(RedisSpider):
             goods_id = response.meta.get('goods_id')
             
             try:
-                # 处理可能的JSONP格式
-                response_text = response.text
-                if response_text.startswith('jsonp'):
-                    response_text = re.sub(r'^jsonp\d+\(', '', response_text).rstrip(')')
-                comment_data = json.loads(response_text)
-            except json.JSONDecodeError as e:
-                self.logger.error(f"解析评论失败: {e}，响应内容: {response.text[:100]}")
-                # 重试评论请求（带退避）
-                if current_page < 3:
-                    retry_delay = 2 **current_page + random.random()
-                    time.sleep(retry_delay)
-                    yield scrapy.Request(
-                        response.url,
-                        callback=self.parse_comments,
-                        meta=response.meta,
-                        headers=self._get_headers(),
-                        priority=3,
-                        errback=self.handle_error,
-                        dont_filter=True
-                    )
+                # 直接解析原始字节（接口返回UTF-8），处理可能的JSONP格式
+                body = response.body
+                if body.startswith(b'jsonp'):
+                    body = _JSONP_RE.sub(b'', body).rstrip(b')')
+                comment_data = orjson.loads(body)
+            except orjson.JSONDecodeError as e:
+                # 只解码前100字节，避免错误路径上对整个响应体做编码探测和解码
+                self.logger.error(
+                    "解析评论失败: %s，响应内容: %s", e,
+                    response.body[:100].decode(response.encoding or 'utf-8', errors='replace')
+                )
+                # 交给Scrapy重试机制调度，次数受RETRY_TIMES限制
+                retry_request = get_retry_request(response.request, spider=self, reason='bad_json')
+                if retry_request:
+                    yield retry_request
                 return
             
             # 多路径提取评论数据
             comments = []
-            comment_paths = [
-                'data.comments',
-                'comments',
-                'data.items',
-                'result.comments'
-            ]
-            for path in comment_paths:
-                current = comment_data
-                for key in path.split('.'):
-                    if isinstance(current, dict) and key in current:
-                        current = current[key]
-                    else:
-                        current = None
-                        break
+            comments_parent = None  # 评论列表所在的字典，翻页标记通常与其同级
+            for path in _COMMENT_PATHS:
+                parent = _walk(comment_data, path[:-1])
+                current = parent.get(path[-1]) if isinstance(parent, dict) else None
                 if current and isinstance(current, list):
                     comments = current
+                    comments_parent = parent
                     break
             
+            # 循环内不变的值提前绑定为局部变量（同一页评论共用一个抓取时间）
+            crawl_time = self._now_str()
+            product_id = item['product_id']
+            comment_total = 0
             for comment in comments:
-                comment_item = CommentItem()
-                comment_item['product_id'] = item['product_id']
-                
                 # 提取评论ID（多来源）
-                comment_id = comment.get('comment_id') or comment.get('id') or comment.get('commentId')
-                comment_item['comment_id'] = str(comment_id) if comment_id else ''
-                if not comment_item['comment_id']:
+                comment_id = _first(comment, _COMMENT_ID_KEYS)
+                if not comment_id:
                     continue  # 跳过无ID的评论
+                comment_item = CommentItem()
+                comment_item['product_id'] = product_id
+                comment_item['comment_id'] = str(comment_id)
                 
                 # 提取用户ID
-                user_id = comment.get('user_id') or comment.get('buyer_id') or comment.get('userId')
+                user_id = _first(comment, _USER_ID_KEYS)
                 comment_item['user_id'] = str(user_id) if user_id else ''
                 
                 # 提取用户名（处理匿名情况）
-                user_name = comment.get('user_name') or comment.get('buyer_name', '').strip() or comment.get('userName', '').strip()
+                user_name = str(_first(comment, _USER_NAME_KEYS)).strip()
                 if not user_name or '匿名' in user_name:
-                    user_name = f"匿名用户_{hashlib.md5(str(user_id).encode()).hexdigest()[:6]}"
+                    # 仅作短标识，用CRC32代替MD5（结果稳定，开销小得多）
+                    user_name = f"匿名用户_{zlib.crc32(str(user_id).encode()) & 0xFFFFFF:06x}"
                 comment_item['user_name'] = user_name
                 
                 # 提取评论内容（清理格式）
-                content = comment.get('content') or comment.get('comment', '').strip() or comment.get('contentText', '').strip()
-                content = re.sub(r'[\r\n\t]+', ' ', content)
+                # 换行、制表符等空白折叠为单个空格（split/join均在C层完成）
+                content = ' '.join(str(_first(comment, _CONTENT_KEYS)).split())
                 comment_item['content'] = content
                 
                 # 提取评分（处理星级转换）
-                rating = comment.get('rating') or comment.get('score', '') or comment.get('star', '')
-                if isinstance(rating, str) and '星' in rating:
-                    rating = re.search(r'(\d+)', rating).group(1) if re.search(r'(\d+)', rating) else ''
-                comment_item['rating'] = str(rating) if rating else ''
+                rating = _first(comment, _RATING_KEYS)
+                if isinstance(rating, str):
+                    # 只有“5星”这类文本才需要正则提取数字，接口多数直接返回数值
+                    if '星' in rating:
+                        match = _DIGIT_RE.search(rating)
+                        rating = match.group(1) if match else ''
+                    comment_item['rating'] = rating
+                else:
+                    comment_item['rating'] = str(rating)
                 
                 # 提取评论时间（多格式处理）
-                comment_time = comment.get('comment_time') or comment.get('create_time', '') or comment.get('time', '')
+                comment_time = _first(comment, _COMMENT_TIME_KEYS)
                 if comment_time:
-                    # 处理时间戳
-                    if str(comment_time).isdigit():
-                        try:
-                            # 处理毫秒级时间戳
-                            if len(str(comment_time)) >= 10:
-                                ts = int(comment_time) // 1000 if len(str(comment_time)) > 10 else int(comment_time)
-                                comment_time = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S')
-                        except:
-                            pass
-                    # 处理其他时间格式
-                    else:
-                        time_formats = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%m-%d %H:%M']
-                        for fmt in time_formats:
-                            try:
-                                dt = datetime.strptime(comment_time, fmt)
-                                comment_time = dt.strftime('%Y-%m-%d %H:%M:%S')
-                                break
-                            except ValueError:
-                                continue
+                    comment_time = _normalize_comment_time(comment_time)
                 comment_item['comment_time'] = comment_time
                 
                 # 提取有用投票数
-                useful_votes = comment.get('useful_votes') or comment.get('like_count', 0) or comment.get('useful', 0)
-                comment_item['useful_votes'] = str(useful_votes) if useful_votes else '0'
+                comment_item['useful_votes'] = str(_first(comment, _USEFUL_VOTES_KEYS, '0'))
                 
                 # 提取回复数
-                reply_count = comment.get('reply_count') or comment.get('replyNum', 0) or 0
-                comment_item['reply_count'] = str(reply_count) if reply_count else '0'
+                comment_item['reply_count'] = str(_first(comment, _REPLY_COUNT_KEYS, '0'))
                 
-                comment_item['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                self.monitor.update_item_stats('comment')
+                comment_item['crawl_time'] = crawl_time
+                comment_total += 1
                 yield comment_item
+            # 整页评论统计一次性累加
+            if comment_total:
+                self.monitor.update_item_stats('comment', n=comment_total)
             
             # 自动检测是否有下一页（根据返回数据）
-            has_more = False
-            more_paths = [
-                'data.has_more',
-                'has_more',
-                'data.hasMore',
-                'result.has_more'
-            ]
-            for path in more_paths:
-                current = comment_data
-                for key in path.split('.'):
-                    if isinstance(current, dict) and key in current:
-                        current = current[key]
-                    else:
-                        current = None
+            # 先在评论列表同级查找，找不到再按候选路径遍历整个响应
+            has_more = None
+            if comments_parent is not None:
+                has_more = comments_parent.get('has_more', comments_parent.get('hasMore'))
+            if has_more is None:
+                for path in _MORE_PATHS:
+                    has_more = _walk(comment_data, path)
+                    if has_more is not None:
                         break
-                if current is not None:
-                    has_more = bool(current)
-                    break
+            has_more = bool(has_more)
             
             if has_more and current_page < (self.max_comments // 20):
                 next_page = current_page + 1
-                # 随机延迟后请求下一页
-                time.sleep(random.uniform(0.8, 2.0))
+                # 按首次调度时的URL模板直接生成下一页地址
+                url_tpl = response.meta.get('url_tpl')
+                if url_tpl:
+                    next_url = url_tpl.format(goods_id=response.meta['goods_id'], page=next_page)
+                else:
+                    next_url = response.url.replace(f'page={current_page}', f'page={next_page}')
+                # 随机延迟后请求下一页（由RequestDelayMiddleware非阻塞等待，耗时从实际发出时算起）
+                delay = random.uniform(0.8, 2.0)
                 yield scrapy.Request(
-                    response.url.replace(f'page={current_page}', f'page={next_page}'),
+                    next_url,
                     callback=self.parse_comments,
-                    meta={** response.meta, 'page': next_page},
+                    meta={**response.meta, 'page': next_page, 'download_delay': delay, 'start_time': time.time() + delay},
                     headers=self._get_headers(),
                     priority=3,
                     errback=self.handle_error
                 )
                 
         except Exception as e:
-            self.logger.error(f"解析评论错误: {e}", exc_info=True)
+            self.logger.error("解析评论错误: %s", e, exc_info=True)
             self.monitor.update_request_stats(success=False)
-            self.error_history.append({
-                'time': datetime.now(),
-                'type': 'comment_parse',
-                'message': str(e)
-            })
+            self._record_error('comment_parse', str(e))
 
     def handle_error(self, failure):
         """统一错误处理回调（增强版）"""
         request = failure.request
-        self.logger.error(f"请求错误: {failure.value}, URL: {request.url}")
+        self.logger.error("请求错误: %s, URL: %s", failure.value, request.url)
         self.monitor.update_request_stats(success=False)
         self.monitor.log_error(str(failure.value), self.name)
         
         # 记录错误历史
-        self.error_history.append({
-            'time': datetime.now(),
-            'type': 'request_error',
-            'message': str(failure.value),
-            'url': request.url
-        })
+        self._record_error('request_error', str(failure.value), url=request.url)
         
         # 错误处理策略
         retry_times = request.meta.get('retry_times', 0)
@@ -863,26 +1079,24 @@ class PDDSpider(RedisSpider):
                 # 403/429通常是反爬，强制更换代理和会话
                 if status in [403, 429]:
                     self.logger.warning(f"收到{status}错误，强制更换代理和会话")
-                    self.proxy_pool.report_failure(request.meta.get('proxy'))
-                    self.proxy = self.proxy_pool.get_working_proxy()
+                    self._switch_proxy(request.meta.get('proxy'))
                     self.session_id = self._generate_session_id()
                     self.device_id = self._generate_device_id()
                     
                     # 指数退避重试
-                    retry_delay = (2 **retry_times) + random.uniform(1, 3)
+                    backoffs = self._RETRY_BACKOFFS
+                    base_delay = backoffs[retry_times] if retry_times < len(backoffs) else 2 ** retry_times
+                    retry_delay = base_delay + random.uniform(1, 3)
                     self.logger.info(f"因{status}错误，延迟{retry_delay:.2f}s后重试第{retry_times+1}次")
                     
                     # 构建新请求
-                    new_request = request.copy()
+                    new_request = request.replace(headers=self._get_headers())  # 使用新会话headers
                     new_request.meta['retry_times'] = retry_times + 1
                     new_request.meta['proxy'] = self.proxy
-                    new_request.headers = self._get_headers()  # 使用新会话headers
                     new_request.dont_filter = True
-                    
-                    # 使用scrapy的重试中间件调度重试
-                    from twisted.internet import reactor
-                    from scrapy.utils.reactor import CallLaterOnce
-                    CallLaterOnce(new_request.callback, new_request)
+                    # 退避延迟交给RequestDelayMiddleware在入队前非阻塞等待（不占用下载并发槽位）
+                    new_request.meta['download_delay'] = retry_delay
+                    yield new_request
             else:
                 # 网络错误，简单重试
                 self.logger.info(f"网络错误，重试第{retry_times+1}次")
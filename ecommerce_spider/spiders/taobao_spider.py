@@ -3,16 +3,118 @@ import json
 import random
 import hashlib
 import re
-from urllib.parse import quote, urlparse, parse_qs
+import secrets
+from collections import deque
+from urllib.parse import quote, unquote_plus
 from datetime import datetime, timedelta
+import orjson
 import scrapy
+from scrapy import signals
+from scrapy.downloadermiddlewares.retry import get_retry_request
 from scrapy_redis.spiders import RedisSpider
+from twisted.internet import reactor, task, threads
 from scrapy.utils.project import get_project_settings
+from pybloom_live import ScalableBloomFilter
 from ecommerce_spider.items import ProductItem, CommentItem, ShopItem
+from ecommerce_spider.dupefilters import canonicalize_url
 from utils.anti_crawler import AntiCrawler
 from utils.monitor import SpiderMonitor
 from utils.proxy_pool import ProxyPool
 
+# 解析回调中使用的预编译正则
+_WS_RE = re.compile(r'[\r\n\t]+')
+_DIGIT_RE = re.compile(r'(\d+)')
+_FLOAT_RE = re.compile(r'(\d+\.\d+)')
+_DATE_RE = re.compile(r'(\d{4}-\d{2}-\d{2})')
+# 从搜索URL中直接提取关键词和页码（替代urlparse+parse_qs）
+_Q_RE = re.compile(r'[?&]q=([^&#]*)')
+_PAGE_RE = re.compile(r'[?&]page=(\d+)')
+# 带单位数字中的数值部分，如"1.5万+"中的1.5
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+# 搜索页数据中商品列表的候选路径（预先拆分为键元组）
+_PRODUCT_LIST_PATHS = (
+    ('mods', 'itemlist', 'data', 'auctions'),
+    ('data', 'items'),
+    ('auctions',),
+    ('itemList',)
+)
+# 商品详情数据中原价的候选路径
+_ORIGINAL_PRICE_PATHS = (
+    ('price', 'originalPrice'),
+    ('reservePrice',),
+    ('skuBase', 'price'),
+    ('itemInfo', 'price')
+)
+
+
+# 搜索页商品数据脚本、详情页价格脚本的特征串（按优先级排列）
+_SEARCH_SCRIPT_MARKERS = ('g_page_config', 'initialData', 'itemList')
+_PRICE_SCRIPT_MARKERS = ('price', 'skuPrice')
+# 搜索页内联数据的赋值前缀（在响应原始字节中直接查找）
+_PAGE_CONFIG_MARKER = b'g_page_config = '
+# 详情页评论数的候选节点（按优先级：.J_RateCounter、.comment-count、含"评价"的span、含commentCount的script），
+# 合并为一次XPath并集查询，结果按文档顺序返回，再在Python中按优先级归类
+_COMMENT_COUNT_XPATH = (
+    '//*[contains(concat(" ", normalize-space(@class), " "), " J_RateCounter ")'
+    ' or contains(concat(" ", normalize-space(@class), " "), " comment-count ")]'
+    ' | //span[contains(., "评价")]'
+    ' | //script[contains(., "commentCount")]'
+)
+
+
+def _find_script(response, markers):
+    """单次遍历页面中的<script>文本，返回包含优先级最高特征串的脚本
+
+    替代对每个候选特征分别执行一次 script:contains(...) 查询。
+    """
+    best, best_rank = None, len(markers)
+    for text in response.xpath('//script/text()').getall():
+        for rank in range(best_rank):
+            if markers[rank] in text:
+                best, best_rank = text, rank
+                break
+        if best_rank == 0:
+            break
+    return best
+
+
+def _find_comment_count(response):
+    """单次查询详情页评论数节点，返回优先级最高且含数字的评论数字符串（无则返回None）
+
+    每个优先级只取文档顺序中的第一个节点（与逐个选择器.get()一致）：
+    前三类取节点自身的首个文本，script取整段源码。
+    """
+    firsts = [None] * 4
+    for node in response.xpath(_COMMENT_COUNT_XPATH):
+        el = node.root
+        classes = (el.get('class') or '').split()
+        if firsts[0] is None and 'J_RateCounter' in classes:
+            firsts[0] = node.xpath('text()').get()
+        if firsts[1] is None and 'comment-count' in classes:
+            firsts[1] = node.xpath('text()').get()
+        if firsts[2] is None and el.tag == 'span' and '评价' in ''.join(el.itertext()):
+            firsts[2] = node.xpath('text()').get()
+        if firsts[3] is None and el.tag == 'script' and 'commentCount' in (el.text or ''):
+            firsts[3] = node.get()
+    for text in firsts:
+        if text:
+            m = _DIGIT_RE.search(text)
+            if m:
+                return m.group(1)
+    return None
+
+
+def _walk(obj, keys):
+    """沿键路径逐层取值，任一层缺失或不是字典时返回None"""
+    try:
+        for key in keys:
+            obj = obj[key]
+    except (KeyError, TypeError, IndexError):
+        return None
+    return obj
+
+
 class TaobaoSpider(RedisSpider):
     """淘宝分布式爬虫"""
     name = "taobao"
@@ -42,6 +144,41 @@ class TaobaoSpider(RedisSpider):
         }
     }
 
+    # 请求头静态部分
+    _BASE_HEADERS = {
+        'Referer': 'https://www.taobao.com/',
+        'X-Requested-With': 'XMLHttpRequest',
+        'Accept': 'application/json, text/javascript, */*; q=0.01',
+        'Accept-Language': 'zh-CN,zh;q=0.9',
+        'Connection': 'keep-alive',
+        'Cache-Control': 'no-cache',
+    }
+    # 淘宝特有的可选请求头（值为None表示每次动态生成）
+    _OPTIONAL_HEADERS = (
+        ('Accept-Encoding', 'gzip, deflate, br'),
+        ('Origin', 'https://www.taobao.com'),
+        ('X-Forwarded-For', None),
+        ('sec-ch-ua', '"Not.A/Brand";v="8", "Chromium";v="114", "Google Chrome";v="114"'),
+        ('sec-ch-ua-mobile', '?1'),
+        ('sec-ch-ua-platform', '"Android"'),
+        ('Sec-Fetch-Dest', 'empty'),
+        ('Sec-Fetch-Mode', 'cors'),
+        ('Sec-Fetch-Site', 'same-origin'),
+    )
+    # 可选请求头的全部3-5项组合（位掩码），每次请求只需随机取一个
+    _OPTIONAL_MASKS = tuple(
+        m for m in range(1 << len(_OPTIONAL_HEADERS)) if 3 <= bin(m).count('1') <= 5
+    )
+
+    # 401/403/429退避参数（秒）：full jitter，延迟在[0, min(上限, 基数*2^重试次数)]内均匀取值
+    _RETRY_BACKOFF_BASE = 1.0
+    _RETRY_BACKOFF_CAP = 60.0
+
+    # 签名盐值预计算：salt1只取决于timestamp % 3600，salt2只取决于APP版本
+    _APP_VERSIONS = ('10.20.0', '10.21.1', '10.22.2')
+    _SALT1 = tuple(hashlib.md5(str(i).encode()).hexdigest()[:10] for i in range(3600))
+    _SALT2 = {v: 'tb_' + hashlib.md5(v.encode()).hexdigest()[:8] for v in _APP_VERSIONS}
+
     def __init__(self, role='worker', *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.role = role
@@ -52,14 +189,19 @@ class TaobaoSpider(RedisSpider):
         self.monitor = SpiderMonitor()
         self.proxy_pool = ProxyPool()
         self.worker_id = hashlib.md5(f"{time.time()}-{random.randint(1, 1000000)}".encode()).hexdigest()[:12]
+        self._health_check = None  # 健康检查定时任务，spider_opened时启动
+        self._health_check_start = None
         self._register_worker()
         self.session_id = self._generate_session_id()
         self.device_id = self._generate_device_id()
         self.task_counter = 0
-        self.error_history = []
+        self.error_history = deque(maxlen=100)  # 最近100条错误记录，超出后自动淘汰最旧的
         self.last_proxy_switch_time = time.time()
         self.proxy = None
         self.user_agent_rotation = self._load_user_agents()
+        # 已调度详情页的商品（进程内一级去重，跨节点仍由Redis去重过滤器兜底）
+        self.seen_filter = ScalableBloomFilter(initial_capacity=1000000, error_rate=1e-4)
+        self._quoted_kw = {}  # 关键词URL编码结果: {keyword: quote(keyword)}
 
     def _load_user_agents(self):
         """加载淘宝专用UA池（移动端+PC端）"""
@@ -80,23 +222,41 @@ class TaobaoSpider(RedisSpider):
                 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148 Taobao/10.20.0'
             ]
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider._start_health_check, signal=signals.spider_opened)
+        crawler.signals.connect(spider._stop_health_check, signal=signals.spider_closed)
+        crawler.signals.connect(spider.monitor.close, signal=signals.spider_closed)
+        return spider
+
     def _register_worker(self):
-        """注册Worker节点并启动健康检查"""
+        """注册Worker节点（健康检查在spider_opened时启动）"""
         self.monitor.register_worker(self.worker_id)
         self.logger.info(f"Taobao Worker节点注册: {self.worker_id}")
-        self._start_health_check()
-
-    def _start_health_check(self):
-        """启动健康检查线程"""
-        from threading import Thread
-        def check():
-            while True:
-                self.monitor.redis_conn.set(f"worker:{self.worker_id}:last_active", datetime.now().timestamp())
-                if time.time() - self.last_proxy_switch_time > 200:
-                    self.proxy = self.proxy_pool.get_working_proxy()
-                    self.last_proxy_switch_time = time.time()
-                time.sleep(25)
-        Thread(target=check, daemon=True).start()
+
+    def _start_health_check(self, spider=None):
+        """启动健康检查定时任务（随机错开首次心跳，避免多个节点同时写Redis）"""
+        self._health_check = task.LoopingCall(self._health_check_once)
+        self._health_check_start = reactor.callLater(
+            random.uniform(0, 25), self._health_check.start, 25
+        )
+
+    def _stop_health_check(self, spider=None):
+        """停止健康检查定时任务"""
+        if self._health_check_start and self._health_check_start.active():
+            self._health_check_start.cancel()
+        if self._health_check and self._health_check.running:
+            self._health_check.stop()
+
+    def _health_check_once(self):
+        """刷新心跳并按需更换代理（Redis写入放到线程池，不阻塞reactor）"""
+        if time.time() - self.last_proxy_switch_time > 200:
+            self.proxy = self.proxy_pool.get_working_proxy()
+            self.last_proxy_switch_time = time.time()
+        d = threads.deferToThread(self.monitor.heartbeat, self.worker_id)
+        d.addErrback(lambda failure: self.logger.warning(f"心跳写入失败: {failure.value}"))
+        return d
 
     def _generate_session_id(self):
         """生成淘宝风格会话ID"""
@@ -109,7 +269,7 @@ class TaobaoSpider(RedisSpider):
         models = ['iphone14', 'mate60', 'mi14', 'reno10', 'x100']
         manufacturer = random.choice(manufacturers)
         model = random.choice(models)
-        serial = ''.join(random.sample('0123456789ABCDEF', 16))
+        serial = secrets.token_hex(8).upper()
         return f"{manufacturer}-{model}-{serial}"
 
     def start_requests(self):
@@ -117,11 +277,8 @@ class TaobaoSpider(RedisSpider):
         if self.role == 'master':
             self.logger.info("Taobao Master节点启动，生成初始任务...")
             start_urls = self.settings.get('SPIDERS', {}).get('taobao', {}).get('start_urls', [])
-            keywords = []
             if start_urls:
-                for url in start_urls:
-                    parsed = urlparse(url)
-                    keywords.append(parse_qs(parsed.query).get('q', [''])[0])
+                keywords = [self._keyword_from_url(url) for url in start_urls]
             else:
                 keywords = ["手机", "电脑", "服装", "美妆", "家居", "零食", "数码"]
             
@@ -131,23 +288,51 @@ class TaobaoSpider(RedisSpider):
                 if kw and kw not in seen_keywords:
                     seen_keywords.add(kw)
                     unique_keywords.append(kw)
+                    self._quoted_kw[kw] = quote(kw)
             
+            # 初始任务一次性写入Redis队列，由所有Worker（包括本节点）分布式消费
             random.shuffle(unique_keywords)
-            for idx, keyword in enumerate(unique_keywords):
-                delay = random.uniform(2.0, 4.0) + idx * 0.2
-                time.sleep(delay)
+            pipe = self.server.pipeline(transaction=False)
+            task_count = 0
+            for keyword in unique_keywords:
                 for page in range(1, self.max_pages + 1):
                     if random.random() > 0.15:
-                        yield self._build_search_request(keyword, page)
+                        pipe.lpush(self.redis_key, self._build_start_task(keyword, page))
+                        task_count += 1
+            pipe.execute()
+            self.logger.info(f"已向 {self.redis_key} 写入 {task_count} 个搜索任务")
         else:
             self.logger.info("Taobao Worker节点启动，等待Redis任务...")
             self.proxy = self.proxy_pool.get_working_proxy()
-            return super().start_requests()
+        yield from super().start_requests()
+
+    def _build_start_task(self, keyword, page):
+        """序列化Redis中的搜索任务"""
+        return json.dumps({'keyword': keyword, 'page': page}, ensure_ascii=False)
+
+    def make_request_from_data(self, data):
+        """将Redis中的搜索任务还原为请求（兼容直接写入的URL）"""
+        text = data.decode(self.redis_encoding) if isinstance(data, bytes) else data
+        if text.startswith('{'):
+            task = json.loads(text)
+            return self._build_search_request(task['keyword'], int(task['page']))
+        m = _PAGE_RE.search(text)
+        return self._build_search_request(self._keyword_from_url(text), int(m.group(1)) if m else 1)
+
+    @staticmethod
+    def _keyword_from_url(url):
+        """从搜索URL的q参数中提取关键词"""
+        m = _Q_RE.search(url)
+        return unquote_plus(m.group(1)) if m else ''
 
     def _build_search_request(self, keyword, page):
         """构建淘宝搜索请求（增强反爬参数）"""
         sign = self.generate_sign(keyword, page)
-        url = f"https://s.taobao.com/search?q={quote(keyword)}&page={page}&sign={sign}"
+        quoted = self._quoted_kw.get(keyword)
+        if quoted is None:
+            quoted = self._quoted_kw[keyword] = quote(keyword)
+        base_url = f"https://s.taobao.com/search?q={quoted}&page={page}"
+        url = f"{base_url}&sign={sign}"
         
         # 淘宝搜索路径随机化
         path_choices = ["search", "s", "list"]
@@ -172,60 +357,43 @@ class TaobaoSpider(RedisSpider):
                 'render_js': True,
                 'retry_times': 0,
                 'proxy': self.proxy,
-                'start_time': time.time()
+                'start_time': time.time(),
+                # 去重键只取关键词和页码，忽略签名、随机路径和冗余参数
+                'dupefilter_key': canonicalize_url(base_url)
             },
             headers=self._get_headers(),
-            errback=self.handle_error,
-            dont_filter=True
+            errback=self.handle_error
         )
 
     def _get_headers(self):
         """生成淘宝专用请求头"""
-        headers = {
-            'Referer': 'https://www.taobao.com/',
-            'X-Requested-With': 'XMLHttpRequest',
-            'tb-session-id': self.session_id,
-            'tb-device-id': self.device_id,
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Accept-Language': 'zh-CN,zh;q=0.9',
-            'Connection': 'keep-alive',
-            'Cache-Control': 'no-cache',
-            'User-Agent': random.choice(self.user_agent_rotation)
-        }
-
         # 每6个任务更换会话ID
         if self.task_counter % 6 == 0 and self.task_counter > 0:
             self.session_id = self._generate_session_id()
-            headers['tb-session-id'] = self.session_id
             if random.random() > 0.25:
                 self.device_id = self._generate_device_id()
-                headers['tb-device-id'] = self.device_id
         
         self.task_counter += 1
+
+        # 基础 headers（静态部分复用类常量）
+        headers = self._BASE_HEADERS.copy()
+        headers['tb-session-id'] = self.session_id
+        headers['tb-device-id'] = self.device_id
+        headers['User-Agent'] = random.choice(self.user_agent_rotation)
         
-        # 淘宝特有头
-        optional_headers = {
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Origin': 'https://www.taobao.com',
-            'X-Forwarded-For': self.anti_crawler.get_random_ip(),
-            'sec-ch-ua': '"Not.A/Brand";v="8", "Chromium";v="114", "Google Chrome";v="114"',
-            'sec-ch-ua-mobile': '?1',
-            'sec-ch-ua-platform': '"Android"',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin'
-        }
-        selected_headers = random.sample(list(optional_headers.items()), random.randint(3, 5))
-        for k, v in selected_headers:
-            headers[k] = v
+        # 淘宝特有头，随机选3-5个
+        mask = random.choice(self._OPTIONAL_MASKS)
+        for i, (k, v) in enumerate(self._OPTIONAL_HEADERS):
+            if mask >> i & 1:
+                headers[k] = v if v is not None else self.anti_crawler.get_random_ip()
             
         return headers
 
     def generate_sign(self, keyword, page):
         """淘宝签名生成（增强版）"""
         timestamp = int(time.time() * 1000)
-        nonce = ''.join(random.sample('0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ', 20))
-        app_version = random.choice(['10.20.0', '10.21.1', '10.22.2'])
+        nonce = secrets.token_hex(10)  # 20位随机串（不含'_'，避免与签名分隔符冲突）
+        app_version = random.choice(self._APP_VERSIONS)
         
         data = (
             f"q={quote(keyword)}&page={page}&ts={timestamp}&nonce={nonce}"
@@ -233,9 +401,9 @@ class TaobaoSpider(RedisSpider):
             f"&network={random.choice(['wifi', '4g', '5g'])}&channel=appstore"
         )
         
-        salt1 = hashlib.md5(str(timestamp % 3600).encode()).hexdigest()[:10]
+        salt1 = self._SALT1[timestamp % 3600]
         temp = hashlib.sha256((data + salt1).encode()).hexdigest()
-        salt2 = 'tb_' + hashlib.md5(app_version.encode()).hexdigest()[:8]
+        salt2 = self._SALT2[app_version]
         sign = hashlib.md5((temp + salt2).encode()).hexdigest()
         
         return f"{sign}_{timestamp}_{nonce}"
@@ -253,54 +421,44 @@ class TaobaoSpider(RedisSpider):
         current_page = response.meta['page']
         
         try:
-            # 多路径提取商品数据
-            product_script = None
-            script_selectors = [
-                'script:contains(g_page_config)',
-                'script:contains(initialData)',
-                'script:contains(itemList)',
-                'script[type="application/json"]'
-            ]
-            for selector in script_selectors:
-                product_script = response.css(selector).get()
-                if product_script:
-                    break
+            # UTF-8页面直接在原始字节中截取g_page_config，免去整页DOM解析和解码
+            raw_data = None
+            if (response.encoding or 'utf-8').lower() in ('utf-8', 'utf8'):
+                body = response.body
+                start = body.find(_PAGE_CONFIG_MARKER)
+                if start >= 0:
+                    start += len(_PAGE_CONFIG_MARKER)
+                    raw_data = body[start:body.find(b'};', start) + 1]
             
-            if not product_script:
-                self.logger.warning(f"未找到商品数据，重试页面 {current_page}")
-                self._handle_parse_failure(response, "未找到商品数据脚本")
-                return
+            if raw_data is None:
+                # 多路径提取商品数据
+                product_script = (
+                    _find_script(response, _SEARCH_SCRIPT_MARKERS)
+                    or response.xpath('//script[@type="application/json"]/text()').get()
+                )
+                
+                if not product_script:
+                    self.logger.warning(f"未找到商品数据，重试页面 {current_page}")
+                    yield from self._handle_parse_failure(response, "未找到商品数据脚本")
+                    return
+                
+                start = product_script.find('g_page_config = ') + len('g_page_config = ')
+                end = product_script.find('};', start) + 1
+                raw_data = product_script[start:end].encode('utf-8')
             
             # 解析淘宝复杂的JSON结构
             try:
-                # 提取g_page_config
-                start = product_script.find('g_page_config = ') + len('g_page_config = ')
-                end = product_script.find('};', start) + 1
-                raw_data = product_script[start:end]
-                raw_data = re.sub(r'undefined', 'null', raw_data)
-                raw_data = re.sub(r'NaN', '0', raw_data)
-                data = json.loads(raw_data)
-            except (json.JSONDecodeError, ValueError) as e:
+                raw_data = raw_data.replace(b'undefined', b'null').replace(b'NaN', b'0')
+                data = orjson.loads(raw_data)
+            except ValueError as e:  # orjson.JSONDecodeError是ValueError的子类
                 self.logger.error(f"解析数据失败: {e}，尝试备用解析方式")
-                self._handle_parse_failure(response, f"数据解析错误: {str(e)}")
+                yield from self._handle_parse_failure(response, f"数据解析错误: {str(e)}")
                 return
             
             # 多路径提取商品列表
             products = []
-            data_paths = [
-                'mods.itemlist.data.auctions',
-                'data.items',
-                'auctions',
-                'itemList'
-            ]
-            for path in data_paths:
-                current = data
-                for key in path.split('.'):
-                    if isinstance(current, dict) and key in current:
-                        current = current[key]
-                    else:
-                        current = None
-                        break
+            for path in _PRODUCT_LIST_PATHS:
+                current = _walk(data, path)
                 if current and isinstance(current, list):
                     products = current
                     break
@@ -314,7 +472,9 @@ class TaobaoSpider(RedisSpider):
                     self.session_id = self._generate_session_id()
                 return
             
-            # 处理商品数据
+            # 处理商品数据（Item统计按页汇总后一次性更新）
+            product_total = 0
+            crawl_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # 同一页的Item共用抓取时间
             for product in products:
                 item = ProductItem()
                 item['platform'] = 'taobao'
@@ -327,7 +487,7 @@ class TaobaoSpider(RedisSpider):
                 
                 # 商品名称处理
                 name = product.get('title', '').strip() or product.get('raw_title', '').strip()
-                item['name'] = re.sub(r'[\r\n\t]+', ' ', name)
+                item['name'] = _WS_RE.sub(' ', name)
                 
                 # 价格处理
                 price_fields = [
@@ -350,28 +510,26 @@ class TaobaoSpider(RedisSpider):
                     item['original_price'] = ''
                 
                 # 销量处理
-                sales = product.get('sales', '') or product.get('deal_cnt', '').strip()
-                if '万' in sales:
-                    sales = sales.replace('万', '0000').replace('+', '')
-                item['sales'] = sales
+                item['sales'] = self._clean_number(product.get('sales') or product.get('deal_cnt'))
                 
                 # 店铺信息
                 item['shop_name'] = product.get('nick', '').strip() or product.get('shop_name', '').strip()
                 item['url'] = f"https://item.taobao.com/item.htm?id={goods_id}"
                 item['category'] = keyword
-                item['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                item['crawl_time'] = crawl_time
                 
-                self.monitor.update_item_stats('product')
+                product_total += 1
                 yield item
                 
-                # 跟进商品详情页
+                # 跟进商品详情页（本地布隆过滤器跳过已调度过详情页的商品）
                 seller_id = product.get('seller_id') or product.get('user_id')
-                if goods_id and seller_id:
+                if goods_id and seller_id and f"goods:{goods_id}" not in self.seen_filter:
                     error_rate = len(self.error_history) / max(self.task_counter, 1)
                     crawl_prob = 0.75 - min(error_rate * 2, 0.45)
                     
                     if random.random() < crawl_prob:
-                        time.sleep(random.uniform(0.5, 1.5))
+                        self.seen_filter.add(f"goods:{goods_id}")
+                        # 随机延迟由RequestDelayMiddleware非阻塞等待
                         yield scrapy.Request(
                             item['url'],
                             callback=self.parse_product,
@@ -382,13 +540,16 @@ class TaobaoSpider(RedisSpider):
                                 'seller_id': seller_id,
                                 'task_type': 'product',
                                 'proxy': self.proxy,
-                                'start_time': time.time()
+                                'start_time': time.time(),
+                                'download_delay': random.uniform(0.5, 1.5)
                             },
                             headers=self._get_headers(),
                             priority=2,
                             errback=self.handle_error
                         )
-            
+            if product_total:
+                self.monitor.update_item_stats('product', n=product_total)
+
             # 分页处理
             if current_page < self.max_pages:
                 next_page = current_page + 1
@@ -396,8 +557,9 @@ class TaobaoSpider(RedisSpider):
                 next_page_prob = 0.65 + min(page_quality - 0.5, 0.35)
                 
                 if random.random() < next_page_prob:
-                    time.sleep(random.uniform(0.8, 1.8))
-                    yield self._build_search_request(keyword, next_page)
+                    next_request = self._build_search_request(keyword, next_page)
+                    next_request.meta['download_delay'] = random.uniform(0.8, 1.8)
+                    yield next_request
                 
         except Exception as e:
             self.logger.error(f"解析搜索页错误: {e}", exc_info=True)
@@ -408,18 +570,18 @@ class TaobaoSpider(RedisSpider):
                 'type': 'search_parse',
                 'message': str(e)
             })
-            if len(self.error_history) > 100:
-                self.error_history.pop(0)
             
             retry_times = response.meta.get('retry_times', 0)
             if retry_times < 4:
                 retry_delay = (2 ** retry_times) + random.random()
                 self.logger.info(f"{retry_times+1}次重试页面 {current_page}，延迟 {retry_delay:.2f}s")
-                time.sleep(retry_delay)
                 yield self._build_search_request(
                     keyword,
                     current_page
-                ).replace(meta={** response.meta, 'retry_times': retry_times + 1})
+                ).replace(
+                    meta={**response.meta, 'retry_times': retry_times + 1, 'download_delay': retry_delay},
+                    dont_filter=True
+                )
 
     def _handle_parse_failure(self, response, reason):
         """处理解析失败"""
@@ -442,6 +604,7 @@ class TaobaoSpider(RedisSpider):
                 response.meta['page']
             ).replace(
                 meta={**response.meta, 'retry_times': retry_times + 1, 'proxy': self.proxy},
+                dont_filter=True,
                 headers=self._get_headers()
             )
 
@@ -457,41 +620,20 @@ class TaobaoSpider(RedisSpider):
         item = response.meta['item']
         goods_id = response.meta.get('goods_id')
         seller_id = response.meta.get('seller_id')
+        crawl_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # 商品与店铺Item共用抓取时间
         
         try:
             # 提取价格和库存信息
-            price_info = None
-            price_selectors = [
-                'script:contains(price)',
-                'script:contains(skuPrice)',
-                'div.price J_price::text',
-                'span.price::text'
-            ]
-            for selector in price_selectors:
-                price_info = response.css(selector).get()
-                if price_info:
-                    break
+            price_info = _find_script(response, _PRICE_SCRIPT_MARKERS)
             
-            if price_info and '<script' in price_info:
+            if price_info:
                 try:
                     start = price_info.find('{')
                     end = price_info.rfind('}') + 1
                     initial_data = json.loads(price_info[start:end].replace('undefined', 'null'))
                     
-                    original_price_paths = [
-                        'price.originalPrice',
-                        'reservePrice',
-                        'skuBase.price',
-                        'itemInfo.price'
-                    ]
-                    for path in original_price_paths:
-                        current = initial_data
-                        for key in path.split('.'):
-                            if isinstance(current, dict) and key in current:
-                                current = current[key]
-                            else:
-                                current = None
-                                break
+                    for path in _ORIGINAL_PRICE_PATHS:
+                        current = _walk(initial_data, path)
                         if current:
                             item['original_price'] = str(current).strip()
                             break
@@ -499,22 +641,10 @@ class TaobaoSpider(RedisSpider):
                     self.logger.error(f"解析价格信息失败: {e}")
             
             # 评论数量
-            comment_count = None
-            comment_selectors = [
-                '.J_RateCounter::text',
-                '.comment-count::text',
-                'span:contains(评价)::text',
-                'script:contains(commentCount)'
-            ]
-            for selector in comment_selectors:
-                comment_text = response.css(selector).get()
-                if comment_text:
-                    comment_count = re.search(r'(\d+)', comment_text)
-                    if comment_count:
-                        comment_count = comment_count.group(1)
-                        break
+            comment_count = _find_comment_count(response)
             
             item['comments_count'] = comment_count if comment_count else ''
+            comment_total = int(comment_count) if comment_count else 0  # 已由_DIGIT_RE保证为纯数字
             
             # 店铺信息
             shop_id = seller_id
@@ -522,7 +652,7 @@ class TaobaoSpider(RedisSpider):
                 shop_item = ShopItem()
                 shop_item['shop_id'] = str(shop_id)
                 shop_item['shop_name'] = item['shop_name']
-                shop_item['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                shop_item['crawl_time'] = crawl_time
                 yield shop_item
                 
                 # 店铺评分
@@ -541,8 +671,8 @@ class TaobaoSpider(RedisSpider):
                 )
             
             # 评论任务
-            if goods_id and seller_id and comment_count and int(comment_count) > 0:
-                pages_needed = min(int(comment_count) // 20 + 1, self.max_comments // 20)
+            if goods_id and seller_id and comment_total > 0:
+                pages_needed = min(comment_total // 20 + 1, self.max_comments // 20)
                 for page in range(1, pages_needed + 1):
                     comment_urls = [
                         f"https://rate.tmall.com/list_detail_rate.htm?itemId={goods_id}&sellerId={seller_id}&currentPage={page}",
@@ -550,7 +680,6 @@ class TaobaoSpider(RedisSpider):
                     ]
                     comment_url = random.choice(comment_urls)
                     
-                    time.sleep(random.uniform(0.8, 1.8))
                     yield scrapy.Request(
                         comment_url,
                         callback=self.parse_comments,
@@ -561,14 +690,15 @@ class TaobaoSpider(RedisSpider):
                             'goods_id': goods_id,
                             'task_type': 'comment',
                             'proxy': self.proxy,
-                            'start_time': time.time()
+                            'start_time': time.time(),
+                            'download_delay': random.uniform(0.8, 1.8)
                         },
                         headers=self._get_headers(),
                         priority=3,
                         errback=self.handle_error
                     )
             
-            item['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            item['crawl_time'] = crawl_time
             yield item
             
         except Exception as e:
@@ -596,7 +726,7 @@ class TaobaoSpider(RedisSpider):
             }
             for key, selector in score_selectors.items():
                 score_text = response.css(selector).get() or ''
-                score = re.search(r'(\d+\.\d+)', score_text)
+                score = _FLOAT_RE.search(score_text)
                 if score:
                     shop_item[key] = score.group(1)
             
@@ -606,7 +736,7 @@ class TaobaoSpider(RedisSpider):
             
             # 开店时间
             open_time_text = response.css('.open-time::text').get(default='').strip()
-            match = re.search(r'(\d{4}-\d{2}-\d{2})', open_time_text)
+            match = _DATE_RE.search(open_time_text)
             if match:
                 shop_item['registered_time'] = match.group(1)
             
@@ -626,25 +756,31 @@ class TaobaoSpider(RedisSpider):
         
         try:
             # 提取评论数据（淘宝评论为JSONP格式，需处理）
-            raw_data = response.text.strip()
+            # UTF-8响应直接解析原始字节；其他编码（如GBK）先转成UTF-8
+            if (response.encoding or 'utf-8').lower() in ('utf-8', 'utf8'):
+                raw_data = response.body.strip()
+            else:
+                raw_data = response.text.strip().encode('utf-8')
             if not raw_data:
                 self.logger.warning(f"评论页面为空，商品ID: {item['product_id']}, 页码: {current_page}")
                 return
             
             # 处理JSONP格式（移除前后包裹的函数调用）
-            if raw_data.startswith('jsonp'):
-                start = raw_data.find('(') + 1
-                end = raw_data.rfind(')')
+            if raw_data.startswith(b'jsonp'):
+                start = raw_data.find(b'(') + 1
+                end = raw_data.rfind(b')')
                 raw_data = raw_data[start:end]
             
-            comment_data = json.loads(raw_data)
+            comment_data = orjson.loads(raw_data)
             comments = comment_data.get('rateDetail', {}).get('rateList', [])
             
             if not comments:
                 self.logger.info(f"该页无评论数据，商品ID: {item['product_id']}, 页码: {current_page}")
                 return
             
-            # 解析每条评论
+            # 解析每条评论（Item统计按页汇总后一次性更新）
+            comment_total = 0
+            crawl_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')  # 同一页的Item共用抓取时间
             for comment in comments:
                 comment_item = CommentItem()
                 comment_item['product_id'] = item['product_id']
@@ -664,10 +800,12 @@ class TaobaoSpider(RedisSpider):
                 comment_item['comment_time'] = comment.get('date', '').strip()
                 comment_item['useful_votes'] = self._clean_number(comment.get('useful', 0))
                 comment_item['reply_count'] = self._clean_number(comment.get('replyCount', 0))
-                comment_item['crawl_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                comment_item['crawl_time'] = crawl_time
                 
                 yield comment_item
-                self.monitor.update_item_stats('comment')
+                comment_total += 1
+            if comment_total:
+                self.monitor.update_item_stats('comment', n=comment_total)
             
             # 生成下一页评论任务
             total_pages = comment_data.get('rateDetail', {}).get('paginator', {}).get('lastPage', 0)
@@ -677,8 +815,7 @@ class TaobaoSpider(RedisSpider):
                     f"https://rate.tmall.com/list_detail_rate.htm?itemId={item['product_id']}"
                     f"&sellerId={seller_id}&currentPage={next_page}"
                 )
-                # 随机延迟避免反爬
-                time.sleep(random.uniform(0.8, 1.5))
+                # 随机延迟避免反爬（由RequestDelayMiddleware非阻塞等待）
                 yield scrapy.Request(
                     next_comment_url,
                     callback=self.parse_comments,
@@ -688,30 +825,37 @@ class TaobaoSpider(RedisSpider):
                         'page': next_page,
                         'task_type': 'comment',
                         'render_js': False,
-                        'proxy': self.proxy
+                        'proxy': self.proxy,
+                        'download_delay': random.uniform(0.8, 1.5)
                     },
                     headers=self._get_headers(),
                     priority=6,
                     errback=self.handle_error
                 )
                 
-        except json.JSONDecodeError as e:
-            self.logger.error(f"评论JSON解析失败: {e}, 响应内容: {raw_data[:100]}")
+        except orjson.JSONDecodeError as e:
+            self.logger.error("评论JSON解析失败: %s, 响应内容: %s", e, raw_data[:100].decode('utf-8', errors='replace'))
             self.monitor.log_error(f"评论解析JSON错误: {str(e)}", self.name)
         except Exception as e:
             self.logger.error(f"解析评论页错误: {e}", exc_info=True)
             self.monitor.update_request_stats(success=False)
 
     def _clean_number(self, num):
-        """清洗数字（处理万/千单位）"""
+        """清洗数字（处理万/千单位，如"1.5万+"→"15000"）"""
         if not num:
             return '0'
-        num_str = str(num).strip()
+        if isinstance(num, int):
+            return str(num)
+        num_str = str(num).replace(',', '')
+        m = _NUMBER_RE.search(num_str)
+        if not m:
+            return '0'
+        value = float(m.group())
         if '万' in num_str:
-            num_str = num_str.replace('万', '0000').replace('+', '')
+            value *= 10000
         elif '千' in num_str:
-            num_str = num_str.replace('千', '000').replace('+', '')
-        return re.sub(r'[^\d]', '', num_str) or '0'
+            value *= 1000
+        return str(int(value))
 
     def handle_error(self, failure):
         """统一错误处理"""
@@ -738,21 +882,35 @@ class TaobaoSpider(RedisSpider):
                     self.session_id = self._generate_session_id()
                     self.device_id = self._generate_device_id()
                     
-                    retry_delay = (2 ** retry_times) + random.uniform(1, 4)
+                    # 各节点的重试时间随机打散，避免同时重试再次触发限流
+                    retry_delay = random.uniform(
+                        0, min(self._RETRY_BACKOFF_CAP, self._RETRY_BACKOFF_BASE * 2 ** retry_times)
+                    )
+                    # 服务端给出Retry-After（秒）时至少等待该时长
+                    retry_after = failure.value.response.headers.get('Retry-After', b'')
+                    if retry_after.isdigit():
+                        retry_delay = max(retry_delay, int(retry_after))
                     self.logger.info(f"因{status}错误，延迟{retry_delay:.2f}s后重试第{retry_times+1}次")
                     
-                    new_request = request.copy()
-                    new_request.meta['retry_times'] = retry_times + 1
-                    new_request.meta['proxy'] = self.proxy
-                    new_request.headers = self._get_headers()
-                    new_request.dont_filter = True
-                    
-                    from twisted.internet import reactor
-                    from scrapy.utils.reactor import CallLaterOnce
-                    CallLaterOnce(new_request.callback, new_request)
+                    # 交给Scrapy重试机制生成请求（计数、降低优先级、重试统计），使用新会话headers
+                    retry_request = get_retry_request(
+                        request.replace(headers=self._get_headers()),
+                        spider=self,
+                        reason=f'http_{status}',
+                        max_retry_times=self.settings.get('RETRY_TIMES', 6)
+                    )
+                    if retry_request:
+                        retry_request.meta['proxy'] = self.proxy
+                        # 退避延迟交给RequestDelayMiddleware在入队前非阻塞等待（不占用下载并发槽位）
+                        retry_request.meta['download_delay'] = retry_delay
+                        yield retry_request
             else:
                 self.logger.info(f"网络错误，重试第{retry_times+1}次")
-                new_request = request.copy()
-                new_request.meta['retry_times'] = retry_times + 1
-                new_request.dont_filter = True
-                yield new_request
\ No newline at end of file
+                retry_request = get_retry_request(
+                    request,
+                    spider=self,
+                    reason=failure.value,
+                    max_retry_times=self.settings.get('RETRY_TIMES', 6)
+                )
+                if retry_request:
+                    yield retry_request
\ No newline at end of file
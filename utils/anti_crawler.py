@@ -2,27 +2,66 @@ import time
 import random
 import pickle
 import os
+import atexit
 import hashlib
+import threading
+import weakref
+from collections import deque
 from datetime import datetime, timedelta
+import orjson
 from scrapy.utils.project import get_project_settings
 
+# 随机字符串字符集（模拟Cookie值等）
+_RANDOM_CHARS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+# 移动端UA特征
+_MOBILE_UA_KEYWORDS = ('Mobile', 'Android', 'iPhone', 'iPad')
+
+
+def _is_mobile_ua(ua):
+    return any(k in ua for k in _MOBILE_UA_KEYWORDS)
+
+
+# 进程内存活的AntiCrawler实例，退出时统一写入未落盘的Cookie（弱引用，不延长实例生命周期）
+_instances = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all_cookies():
+    for instance in list(_instances):
+        instance.flush_cookies()
+
 class AntiCrawler:
     """反爬工具类，处理Cookie管理、User-Agent轮换、签名生成等反爬机制"""
+    COOKIE_SAVE_INTERVAL = 5.0  # Cookie落盘最小间隔（秒），期间的变更合并写入
+    COOKIE_POOL_SIZE = 5  # 每个平台Cookie池上限，超出时自动淘汰最旧的
+
     def __init__(self):
         # 初始化配置
         self.settings = get_project_settings()
+        # 默认随机延迟范围只读取一次配置
+        self._default_delay_range = tuple(
+            self.settings.get('ANTI_CRAWLER', {}).get('random_delay', [0.5, 1.5])
+        )
         self.ua_list = self._load_user_agents()
+        self.mobile_ua_list = [ua for ua in self.ua_list if _is_mobile_ua(ua)]  # 加载时预先筛出移动端UA
         self.proxy_list = []
         self.working_proxies = []
         
         # Cookie存储结构（增强版，支持多账户轮换）
         self.cookie_store = {
-            'taobao': {'cookies_pool': [], 'current_idx': 0, 'expire_time': 0},
-            'jd': {'cookies_pool': [], 'current_idx': 0, 'expire_time': 0},
-            'pdd': {'cookies_pool': [], 'current_idx': 0, 'expire_time': 0}
+            'taobao': {'cookies_pool': deque(maxlen=self.COOKIE_POOL_SIZE), 'current_idx': 0, 'expire_time': 0},
+            'jd': {'cookies_pool': deque(maxlen=self.COOKIE_POOL_SIZE), 'current_idx': 0, 'expire_time': 0},
+            'pdd': {'cookies_pool': deque(maxlen=self.COOKIE_POOL_SIZE), 'current_idx': 0, 'expire_time': 0}
         }
-        self.cookie_file = 'cookie_store.pkl'
+        self.cookie_file = 'cookie_store.json'
+        self.legacy_cookie_file = 'cookie_store.pkl'  # 旧版pickle格式，仅在JSON文件不存在时迁移一次
+        self._cookies_dirty = False  # 内存中的Cookie是否有未落盘的变更
+        self._last_cookie_save = 0.0
+        self._flush_timer = None  # 节流期内发生变更时安排的延迟落盘定时器
+        self._flush_lock = threading.Lock()
+        self._cookie_headers = {}  # 预格式化的Cookie头: {platform: [与cookies_pool一一对应的字符串]}，池变更时失效
         self.load_cookies()
+        _instances.add(self)  # 进程退出前写入最后一批变更
         
         # 初始化代理池
         self.load_proxies()
@@ -46,17 +85,16 @@ class AntiCrawler:
         if not self.ua_list:
             return self._load_user_agents()[0]
             
-        if mobile:
-            # 筛选移动端UA
-            mobile_keywords = ['Mobile', 'Android', 'iPhone', 'iPad']
-            mobile_uas = [ua for ua in self.ua_list if any(k in ua for k in mobile_keywords)]
-            return random.choice(mobile_uas) if mobile_uas else random.choice(self.ua_list)
+        if mobile and self.mobile_ua_list:
+            return random.choice(self.mobile_ua_list)
         return random.choice(self.ua_list)
 
     def add_ua(self, ua):
         """添加新的User-Agent到列表"""
         if ua not in self.ua_list:
             self.ua_list.append(ua)
+            if _is_mobile_ua(ua):
+                self.mobile_ua_list.append(ua)
 
     def load_proxies(self):
         """加载代理列表（从配置或文件）"""
@@ -84,29 +122,83 @@ class AntiCrawler:
 
     def load_cookies(self):
         """加载Cookie存储（支持多账户池）"""
+        self._cookie_headers.clear()
         try:
             if os.path.exists(self.cookie_file) and os.path.getsize(self.cookie_file) > 0:
                 with open(self.cookie_file, 'rb') as f:
+                    self.cookie_store = orjson.loads(f.read())
+                self._restore_cookie_pools()
+            elif os.path.exists(self.legacy_cookie_file) and os.path.getsize(self.legacy_cookie_file) > 0:
+                with open(self.legacy_cookie_file, 'rb') as f:
                     self.cookie_store = pickle.load(f)
-        except (FileNotFoundError, EOFError, pickle.UnpicklingError) as e:
+                self._restore_cookie_pools()
+                self.save_cookies()
+                print(f"已将 {self.legacy_cookie_file} 迁移为 {self.cookie_file}")
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, orjson.JSONDecodeError) as e:
             print(f"加载Cookie失败: {e}，使用默认配置")
             # 初始化多账户Cookie池
             for platform in self.cookie_store:
-                self.cookie_store[platform]['cookies_pool'] = [
-                    self._generate_platform_cookies(platform) for _ in range(3)  # 每个平台3个Cookie账户
-                ]
+                self.cookie_store[platform]['cookies_pool'] = deque(
+                    (self._generate_platform_cookies(platform) for _ in range(3)),  # 每个平台3个Cookie账户
+                    maxlen=self.COOKIE_POOL_SIZE
+                )
                 self.cookie_store[platform]['expire_time'] = time.time() + 3600 * 8  # 8小时有效期
 
+    def _restore_cookie_pools(self):
+        """将文件中读出的Cookie池列表恢复为定长deque"""
+        for cookies_info in self.cookie_store.values():
+            cookies_info['cookies_pool'] = deque(
+                cookies_info.get('cookies_pool', ()), maxlen=self.COOKIE_POOL_SIZE
+            )
+
     def save_cookies(self):
-        """保存Cookie到文件"""
+        """保存Cookie到文件（先写临时文件再替换，避免中途崩溃留下残缺文件）"""
+        self._last_cookie_save = time.time()
+        self._cookies_dirty = False
+        tmp_file = f"{self.cookie_file}.tmp"
         try:
-            with open(self.cookie_file, 'wb') as f:
-                pickle.dump(self.cookie_store, f)
+            with open(tmp_file, 'wb') as f:
+                f.write(orjson.dumps(self.cookie_store, default=list))  # deque按列表写入
+            os.replace(tmp_file, self.cookie_file)
         except Exception as e:
             print(f"保存Cookie错误: {e}")
 
-    def _get_valid_cookies(self, platform):
-        """获取有效的Cookie（支持账户轮换）"""
+    def _mark_cookies_dirty(self):
+        """标记Cookie已变更：距上次落盘超过COOKIE_SAVE_INTERVAL时立即写文件，
+        否则安排定时器在间隔到期时写入，保证变更最迟在一个间隔内落盘"""
+        self._cookies_dirty = True
+        wait = self._last_cookie_save + self.COOKIE_SAVE_INTERVAL - time.time()
+        with self._flush_lock:
+            if wait <= 0:
+                self._cancel_flush_timer()
+                self.save_cookies()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(wait, self._maybe_flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _maybe_flush(self):
+        """定时器回调：写入节流期内积累的变更"""
+        with self._flush_lock:
+            self._flush_timer = None
+            if self._cookies_dirty:
+                self.save_cookies()
+
+    def _cancel_flush_timer(self):
+        """取消尚未触发的延迟落盘（需持有_flush_lock）"""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def flush_cookies(self):
+        """写入尚未落盘的Cookie变更"""
+        with self._flush_lock:
+            self._cancel_flush_timer()
+            if self._cookies_dirty:
+                self.save_cookies()
+
+    def _next_cookie_index(self, platform):
+        """返回本次轮换到的Cookie池下标（池为空或过期时先重新生成）"""
         current_time = time.time()
         cookies_info = self.cookie_store.get(platform, {})
         
@@ -114,17 +206,35 @@ class AntiCrawler:
         if (not cookies_info['cookies_pool'] or 
             current_time > cookies_info.get('expire_time', 0)):
             # 生成新的Cookie池
-            cookies_info['cookies_pool'] = [
-                self._generate_platform_cookies(platform) for _ in range(3)
-            ]
+            cookies_info['cookies_pool'] = deque(
+                (self._generate_platform_cookies(platform) for _ in range(3)),
+                maxlen=self.COOKIE_POOL_SIZE
+            )
             cookies_info['expire_time'] = current_time + 3600 * 8  # 8小时有效期
             cookies_info['current_idx'] = 0
-            self.save_cookies()
+            self._cookie_headers.pop(platform, None)
+            self._mark_cookies_dirty()
         
         # 实现Cookie轮换（轮询策略）
-        cookies = cookies_info['cookies_pool'][cookies_info['current_idx']]
-        cookies_info['current_idx'] = (cookies_info['current_idx'] + 1) % len(cookies_info['cookies_pool'])
-        return cookies
+        idx = cookies_info['current_idx'] % len(cookies_info['cookies_pool'])
+        cookies_info['current_idx'] = (idx + 1) % len(cookies_info['cookies_pool'])
+        return idx
+
+    def _get_valid_cookies(self, platform):
+        """获取有效的Cookie（支持账户轮换）"""
+        idx = self._next_cookie_index(platform)
+        return self.cookie_store[platform]['cookies_pool'][idx]
+
+    def _get_cookie_string(self, platform):
+        """按轮换顺序获取Cookie请求头字符串（每个Cookie池只格式化一次）"""
+        idx = self._next_cookie_index(platform)
+        headers = self._cookie_headers.get(platform)
+        if headers is None:
+            headers = self._cookie_headers[platform] = [
+                '; '.join(f"{c['name']}={c['value']}" for c in cookies)
+                for cookies in self.cookie_store[platform]['cookies_pool']
+            ]
+        return headers[idx]
 
     def _generate_platform_cookies(self, platform):
         """根据平台生成Cookie"""
@@ -138,18 +248,15 @@ class AntiCrawler:
 
     def get_taobao_cookie_string(self):
         """获取淘宝Cookie字符串（用于请求头）"""
-        cookies = self._get_valid_cookies('taobao')
-        return '; '.join([f"{c['name']}={c['value']}" for c in cookies])
+        return self._get_cookie_string('taobao')
 
     def get_jd_cookie_string(self):
         """获取京东Cookie字符串"""
-        cookies = self._get_valid_cookies('jd')
-        return '; '.join([f"{c['name']}={c['value']}" for c in cookies])
+        return self._get_cookie_string('jd')
 
     def get_pdd_cookie_string(self):
         """获取拼多多Cookie字符串"""
-        cookies = self._get_valid_cookies('pdd')
-        return '; '.join([f"{c['name']}={c['value']}" for c in cookies])
+        return self._get_cookie_string('pdd')
 
     def save_response_cookies(self, platform, response):
         """从响应中提取并保存Cookie"""
@@ -184,12 +291,10 @@ class AntiCrawler:
             cookies.append(cookie)
             
         if cookies:
-            # 添加到Cookie池
+            # 添加到Cookie池（deque达到上限时自动淘汰最旧的）
             self.cookie_store[platform]['cookies_pool'].append(cookies)
-            # 限制池大小为5
-            if len(self.cookie_store[platform]['cookies_pool']) > 5:
-                self.cookie_store[platform]['cookies_pool'].pop(0)
-            self.save_cookies()
+            self._cookie_headers.pop(platform, None)
+            self._mark_cookies_dirty()
 
     def generate_taobao_cookies(self):
         """生成模拟的淘宝Cookie"""
@@ -228,23 +333,19 @@ class AntiCrawler:
 
     def generate_random_string(self, length):
         """生成指定长度的随机字符串"""
-        chars = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-        return ''.join(random.choice(chars) for _ in range(length))
+        return ''.join(random.choices(_RANDOM_CHARS, k=length))
 
     def get_random_delay(self, base_range=None):
-        """生成随机延迟时间（模拟人类行为）"""
-        if base_range:
-            min_delay, max_delay = base_range
-        else:
-            # 从配置获取默认延迟范围
-            min_delay, max_delay = self.settings.get('ANTI_CRAWLER', {}).get('random_delay', [0.5, 1.5])
+        """生成随机延迟时间（模拟人类行为，未指定范围时使用配置的默认范围）"""
+        min_delay, max_delay = base_range or self._default_delay_range
         return random.uniform(min_delay, max_delay)
 
     def generate_taobao_sign(self, keyword, page, timestamp):
         """生成淘宝搜索签名"""
         salt = 'tb_search_' + self.generate_random_string(8)
         sign_str = f"keyword={keyword}&page={page}&ts={timestamp}&salt={salt}"
-        return hashlib.md5(sign_str.encode()).hexdigest()
+        # 16字节BLAKE2b，与原MD5签名同为32位十六进制串
+        return hashlib.blake2b(sign_str.encode(), digest_size=16).hexdigest()
 
     def get_random_ip(self):
         """生成随机IP地址（用于X-Forwarded-For头）"""
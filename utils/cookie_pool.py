@@ -13,50 +13,62 @@ class CookiePool:
         self.refresh_interval = refresh_interval  # 刷新间隔（秒）
         self.platform = platform  # 目标平台
         self.generate_func = generate_func  # Cookie生成函数
-        self.cookies = []  # 可用Cookie列表
+        self.cookies = []  # 可用Cookie列表（按created_at从新到旧排列）
         self.failed_cookies = set()  # 失败Cookie标记
         self.lock = Lock()  # 线程锁
         self._init_pool()
 
     def _init_pool(self):
-        """初始化Cookie池"""
+        """初始化Cookie池（生成过程不持有锁）"""
         if not self.generate_func:
             logger.warning("未设置Cookie生成函数，Cookie池初始化失败")
             return
         
         # 填充Cookie池
+        new_cookies = []
         for _ in range(self.pool_size):
             try:
                 cookie = self.generate_func()
                 if cookie:
-                    self.cookies.append(cookie)
+                    new_cookies.append(cookie)
             except Exception as e:
                 logger.error(f"生成Cookie失败: {str(e)}")
         
+        with self.lock:
+            # 并发初始化时只补足到池大小
+            self.cookies.extend(new_cookies[:max(0, self.pool_size - len(self.cookies))])
+            self._sort_cookies()
         logger.info(f"{self.platform} Cookie池初始化完成，可用Cookie: {len(self.cookies)}/{self.pool_size}")
 
+    def _sort_cookies(self):
+        """按生成时间从新到旧排列Cookie（仅在池内容变更时调用，需持有锁）"""
+        self.cookies.sort(key=lambda x: x.get('created_at', 0), reverse=True)
+
+    def _pick_cookie(self):
+        """从较新的前半部分Cookie中随机选择一个（需持有锁）"""
+        return self.cookies[random.randrange(max(1, len(self.cookies) // 2))]
+
     def get_cookie(self):
         """获取一个可用Cookie（随机选择）"""
         with self.lock:
-            if not self.cookies:
-                self._init_pool()  # 池为空时重新初始化
-            
             if self.cookies:
-                # 优先选择最近生成的Cookie
-                self.cookies.sort(key=lambda x: x.get('created_at', 0), reverse=True)
-                return random.choice(self.cookies[:max(1, len(self.cookies)//2)])  # 选择前半部分较新的
-            return None
+                return self._pick_cookie()
+        
+        self._init_pool()  # 池为空时在锁外重新生成，不阻塞其他线程
+        with self.lock:
+            return self._pick_cookie() if self.cookies else None
 
     def mark_cookie_failed(self, cookie):
         """标记失败的Cookie"""
         if not cookie:
             return
         
+        # 生成Cookie唯一标识（无需持有锁）
+        cookie_key = self._get_cookie_key(cookie)
         with self.lock:
-            # 生成Cookie唯一标识
-            cookie_key = self._get_cookie_key(cookie)
             self.failed_cookies.add(cookie_key)
-            logger.debug(f"标记失败Cookie: {cookie_key}，当前失败数: {len(self.failed_cookies)}")
+            failed_total = len(self.failed_cookies)
+        logger.debug(f"标记失败Cookie: {cookie_key}，当前失败数: {failed_total}")
 
     def refresh_expired(self):
         """刷新过期或失败的Cookie"""
@@ -93,6 +105,7 @@ class CookiePool:
 
             # 更新Cookie池
             self.cookies = valid_cookies[:self.pool_size]  # 截断到池大小
+            self._sort_cookies()
             self.failed_cookies.clear()  # 清空失败标记
             logger.info(f"{self.platform} Cookie池刷新完成，当前可用: {len(self.cookies)}/{self.pool_size}")
 
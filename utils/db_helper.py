@@ -3,6 +3,8 @@ import pymysql
 from contextlib import contextmanager
 import logging
 from datetime import datetime
+from threading import RLock
+from dbutils.pooled_db import PooledDB
 
 logger = logging.getLogger(__name__)
 
@@ -12,42 +14,79 @@ class DBHelper:
         """初始化数据库连接配置"""
         self.db_type = db_config.get('type', 'sqlite')
         self.config = db_config
+        self._sqlite_conn = None  # SQLite共用的单个连接（写操作本身串行，由锁保护）
+        self._sqlite_lock = RLock()
+        self.pool = None  # MySQL连接池
+        if self.db_type == 'mysql':
+            self.pool = PooledDB(
+                creator=pymysql,
+                mincached=2,
+                maxcached=10,
+                maxconnections=20,
+                blocking=True,  # 连接用尽时等待而不是报错
+                ping=1,  # 取出连接时检查可用性，断线自动重连
+                host=self.config.get('host', 'localhost'),
+                port=self.config.get('port', 3306),
+                user=self.config.get('user', 'root'),
+                password=self.config.get('password', ''),
+                db=self.config.get('db', 'ecommerce'),
+                charset='utf8mb4',
+                cursorclass=pymysql.cursors.DictCursor
+            )
         self._test_connection()  # 初始化时测试连接
 
+    def _get_sqlite_conn(self):
+        """获取（必要时创建）共用的SQLite连接"""
+        if self._sqlite_conn is None:
+            self._sqlite_conn = sqlite3.connect(
+                self.config.get('path', 'ecommerce.db'),
+                check_same_thread=False
+            )
+            self._sqlite_conn.row_factory = sqlite3.Row  # 支持按列名访问
+            # WAL模式下写入不阻塞读取；NORMAL同步级别在WAL下仍保证数据库一致性
+            self._sqlite_conn.execute("PRAGMA journal_mode=WAL")
+            self._sqlite_conn.execute("PRAGMA synchronous=NORMAL")
+            self._sqlite_conn.execute("PRAGMA cache_size=-65536")  # 64MB页缓存
+        return self._sqlite_conn
+
     @contextmanager
     def get_connection(self):
-        """数据库连接上下文管理器（自动处理连接生命周期）"""
-        conn = None
-        try:
-            if self.db_type == 'sqlite':
-                conn = sqlite3.connect(
-                    self.config.get('path', 'ecommerce.db'),
-                    check_same_thread=False
-                )
-                conn.row_factory = sqlite3.Row  # 支持按列名访问
-            elif self.db_type == 'mysql':
-                conn = pymysql.connect(
-                    host=self.config.get('host', 'localhost'),
-                    port=self.config.get('port', 3306),
-                    user=self.config.get('user', 'root'),
-                    password=self.config.get('password', ''),
-                    db=self.config.get('db', 'ecommerce'),
-                    charset='utf8mb4',
-                    cursorclass=pymysql.cursors.DictCursor
-                )
-            else:
-                raise ValueError(f"不支持的数据库类型: {self.db_type}")
-            
-            yield conn
-            conn.commit()  # 自动提交事务
-        except Exception as e:
-            if conn:
-                conn.rollback()  # 出错时回滚
-            logger.error(f"数据库连接错误: {str(e)}")
-            raise
-        finally:
-            if conn:
-                conn.close()  # 确保连接关闭
+        """数据库连接上下文管理器（复用连接，自动提交/回滚事务）"""
+        if self.db_type == 'sqlite':
+            with self._sqlite_lock:
+                conn = self._get_sqlite_conn()
+                try:
+                    yield conn
+                    conn.commit()  # 自动提交事务
+                except Exception as e:
+                    conn.rollback()  # 出错时回滚
+                    logger.error(f"数据库连接错误: {str(e)}")
+                    raise
+        elif self.db_type == 'mysql':
+            conn = None
+            try:
+                conn = self.pool.connection()
+                yield conn
+                conn.commit()  # 自动提交事务
+            except Exception as e:
+                if conn:
+                    conn.rollback()  # 出错时回滚
+                logger.error(f"数据库连接错误: {str(e)}")
+                raise
+            finally:
+                if conn:
+                    conn.close()  # 归还连接池，并不真正断开
+        else:
+            raise ValueError(f"不支持的数据库类型: {self.db_type}")
+
+    def close(self):
+        """关闭共用的SQLite连接和MySQL连接池"""
+        if self._sqlite_conn is not None:
+            with self._sqlite_lock:
+                self._sqlite_conn.close()
+                self._sqlite_conn = None
+        if self.pool is not None:
+            self.pool.close()
 
     def execute_update(self, query, params=None):
         """执行更新操作（INSERT/UPDATE/DELETE）"""
@@ -91,13 +130,14 @@ class DBHelper:
         query = f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({placeholders})"
         
         total = 0
-        # 分批插入
-        for i in range(0, len(data_list), batch_size):
-            batch = data_list[i:i+batch_size]
-            params = [tuple(item.values()) for item in batch]
-            
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+        # 整个列表在一个事务内插入；SQLite无需分批，MySQL按batch_size分批以控制单条语句大小
+        if self.db_type == 'sqlite':
+            batch_size = len(data_list)
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            for i in range(0, len(data_list), batch_size):
+                batch = data_list[i:i+batch_size]
+                params = [tuple(item[f] for f in fields) for item in batch]
                 try:
                     cursor.executemany(query, params)
                     affected = cursor.rowcount
@@ -1,19 +1,47 @@
 import time
-import datetime
+import logging
+from datetime import datetime, timedelta
 import redis
 import psutil
+from twisted.internet import task, threads
 from scrapy.utils.project import get_project_settings
 
+logger = logging.getLogger(__name__)
+
+# 同一进程内的监控器按(host, port, db)共用Redis连接池
+_redis_pools = {}
+# 每个连接池的最大连接数（心跳线程和reactor线程池中的监控任务共用，超出时排队等待而不是新建连接）
+_REDIS_MAX_CONNECTIONS = 16
+
+
+def _get_redis_pool(host, port, db):
+    """获取（必要时创建）共享的Redis连接池"""
+    key = (host, port, db)
+    pool = _redis_pools.get(key)
+    if pool is None:
+        pool = _redis_pools.setdefault(key, redis.BlockingConnectionPool(
+            host=host, port=port, db=db, decode_responses=True,
+            max_connections=_REDIS_MAX_CONNECTIONS, timeout=5
+        ))
+    return pool
+
+
 class SpiderMonitor:
     """爬虫监控器，负责统计请求、节点状态及告警"""
+    HEARTBEAT_KEY = 'worker:heartbeats'  # 节点心跳哈希: {worker_id: 时间戳}
+    HEARTBEAT_TTL = 120  # 心跳哈希过期时间（秒），为心跳间隔的数倍
+    # 定期任务间隔（秒）：告警检查最频繁，统计保存次之，离线节点清理最少
+    ALERT_INTERVAL = 10
+    STATS_INTERVAL = 30
+    CLEANUP_INTERVAL = 60
+
     def __init__(self):
         self.settings = get_project_settings()
-        self.redis_conn = redis.Redis(
-            host=self.settings.get('REDIS_HOST', 'localhost'),
-            port=self.settings.get('REDIS_PORT', 6379),
-            db=self.settings.get('REDIS_MONITOR_DB', 2),
-            decode_responses=True
-        )
+        self.redis_conn = redis.Redis(connection_pool=_get_redis_pool(
+            self.settings.get('REDIS_HOST', 'localhost'),
+            self.settings.get('REDIS_PORT', 6379),
+            self.settings.get('REDIS_MONITOR_DB', 2)
+        ))
         # 初始化统计结构
         self.stats = {
             'total_requests': 0,
@@ -25,6 +53,7 @@ class SpiderMonitor:
                 'pdd': {'requests': 0, 'success': 0, 'fail': 0}
             },
             'item_stats': {'product': 0, 'comment': 0, 'shop': 0},
+            'error_stats': {},  # 按爬虫统计的解析/请求错误数
             'nodes': {}  # 节点状态: {worker_id: {last_active, cpu, memory}}
         }
         # 告警阈值配置
@@ -33,21 +62,86 @@ class SpiderMonitor:
             'node_timeout': 60,   # 节点60秒未活跃视为离线
             'min_working_nodes': 2  # 最小工作节点数
         }
-        # 启动监控线程
-        self._start_monitor_thread()
-
-    def _start_monitor_thread(self):
-        """启动后台监控线程，定期保存统计和检查告警"""
-        import threading
-        def monitor_loop():
-            while True:
-                self._save_stats_to_redis()  # 每30秒保存一次统计
-                self._check_alerts()         # 检查告警条件
-                self._clean_expired_nodes()  # 清理离线节点
-                time.sleep(30)
-        
-        thread = threading.Thread(target=monitor_loop, daemon=True)
-        thread.start()
+        # 本机CPU/内存占用，随统计保存任务定期采样，update_worker_status直接读取
+        psutil.cpu_percent(interval=None)  # 首次调用只建立基准，返回值无意义
+        self._cpu_pct = 0.0
+        self._mem_pct = psutil.virtual_memory().percent
+        self._dirty_workers = set()  # 状态已更新、尚未写入Redis的节点，随统计保存一并写入
+        # 启动定期监控任务
+        self._loops = []
+        self._start_monitor_loops()
+
+    def _start_monitor_loops(self):
+        """按各自间隔调度统计保存、告警检查和离线节点清理
+
+        由reactor定时触发：先在reactor线程复制一份统计快照，再把基于快照的Redis读写
+        放到reactor线程池执行，不阻塞下载，也不与reactor线程上的统计更新并发遍历同一字典；
+        上一轮未完成时LoopingCall不会重叠触发下一轮。
+        """
+        for func, interval, take_dirty in (
+            (self._check_alerts, self.ALERT_INTERVAL, False),
+            (self._flush_stats, self.STATS_INTERVAL, True),  # 只有统计保存任务写入节点状态
+            (self._clean_expired_nodes, self.CLEANUP_INTERVAL, False),
+        ):
+            loop = task.LoopingCall(self._run_in_thread, func, take_dirty)
+            loop.start(interval, now=False)
+            self._loops.append(loop)
+
+    def _run_in_thread(self, func, take_dirty=False):
+        """在reactor线程生成统计快照，交给线程池执行定期任务
+
+        take_dirty为True时快照取走待写入的节点集合；任务失败时在reactor线程把它们并回，
+        下一轮重新写入，避免Redis短暂故障丢失节点状态。
+        """
+        stats = self._snapshot_stats(take_dirty)
+        d = threads.deferToThread(self._run_safely, func, stats)
+        if stats['dirty_workers']:
+            d.addCallback(lambda ok: ok or self._dirty_workers.update(stats['dirty_workers']))
+        return d
+
+    def _run_safely(self, func, stats):
+        """执行定期任务并记录异常（避免单次失败导致LoopingCall停止），返回是否成功"""
+        try:
+            func(stats)
+            return True
+        except Exception as e:
+            logger.error(f"监控任务 {func.__name__} 执行失败: {e}")
+            return False
+
+    def _snapshot_stats(self, take_dirty=False):
+        """复制当前统计（在reactor线程调用）；take_dirty为True时一并取走待写入的节点集合"""
+        stats = self.stats
+        dirty_workers = set()
+        if take_dirty:
+            dirty_workers, self._dirty_workers = self._dirty_workers, set()
+        return {
+            'total_requests': stats['total_requests'],
+            'success_requests': stats['success_requests'],
+            'failed_requests': stats['failed_requests'],
+            'spider_stats': {name: dict(data) for name, data in stats['spider_stats'].items()},
+            'item_stats': dict(stats['item_stats']),
+            'error_stats': dict(stats['error_stats']),
+            # 先整体复制（C层一次完成）再逐个复制，心跳线程只修改节点字段，不增删节点
+            'nodes': {worker_id: dict(node) for worker_id, node in dict(stats['nodes']).items()},
+            'dirty_workers': dirty_workers,
+        }
+
+    def close(self):
+        """停止定期监控任务（爬虫关闭时调用）"""
+        for loop in self._loops:
+            if loop.running:
+                loop.stop()
+        self._loops.clear()
+
+    def _flush_stats(self, stats):
+        """采样本机资源占用并保存统计"""
+        self._sample_system_usage()
+        self._save_stats_to_redis(stats)
+
+    def _sample_system_usage(self):
+        """采样CPU/内存占用（cpu_percent非阻塞，返回距上次采样的平均值）"""
+        self._cpu_pct = psutil.cpu_percent(interval=None)
+        self._mem_pct = psutil.virtual_memory().percent
 
     def update_request_stats(self, success=True, spider_name=None):
         """更新请求统计（按爬虫区分）"""
@@ -65,10 +159,15 @@ class SpiderMonitor:
             else:
                 self.stats['spider_stats'][spider_name]['fail'] += 1
 
-    def update_item_stats(self, item_type):
-        """更新爬取到的Item统计"""
+    def update_item_stats(self, item_type, n=1):
+        """更新爬取到的Item统计（n为本次新增数量，支持批量累加）"""
         if item_type in self.stats['item_stats']:
-            self.stats['item_stats'][item_type] += 1
+            self.stats['item_stats'][item_type] += n
+
+    def log_error(self, message, spider_name=None):
+        """记录爬虫错误（仅更新内存统计，随定期统计一并保存）"""
+        key = spider_name or 'unknown'
+        self.stats['error_stats'][key] = self.stats['error_stats'].get(key, 0) + 1
 
     def register_worker(self, worker_id):
         """注册工作节点"""
@@ -84,73 +183,106 @@ class SpiderMonitor:
         })
 
     def update_worker_status(self, worker_id):
-        """更新节点状态（CPU/内存）"""
-        if worker_id in self.stats['nodes']:
-            self.stats['nodes'][worker_id].update({
+        """更新节点状态（CPU/内存，仅更新内存并标记待写入，由定期统计任务批量保存到Redis）"""
+        node = self.stats['nodes'].get(worker_id)
+        if node is not None:
+            node.update({
                 'last_active': datetime.now().timestamp(),
-                'cpu_usage': psutil.cpu_percent(interval=0.1),
-                'memory_usage': psutil.virtual_memory().percent
-            })
-            # 保存到Redis
-            self.redis_conn.hset(f"worker:{worker_id}", mapping={
-                'last_active': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'cpu_usage': self.stats['nodes'][worker_id]['cpu_usage'],
-                'memory_usage': self.stats['nodes'][worker_id]['memory_usage']
+                'cpu_usage': self._cpu_pct,
+                'memory_usage': self._mem_pct
             })
+            self._dirty_workers.add(worker_id)
+
+    def heartbeat(self, worker_id):
+        """刷新节点活跃时间（写入共享心跳哈希和节点哈希，一次pipeline完成）
+
+        所有节点的心跳集中在HEARTBEAT_KEY一个哈希中（field为worker_id），
+        查询存活节点用HGETALL即可，无需按worker:*:last_active扫描键空间；
+        哈希整体设置过期时间，全部节点停止后自动清理。
+        """
+        now = datetime.now()
+        node = self.stats['nodes'].get(worker_id)
+        if node is not None:
+            node['last_active'] = now.timestamp()
+        pipe = self.redis_conn.pipeline(transaction=False)
+        pipe.hset(self.HEARTBEAT_KEY, worker_id, now.timestamp())
+        pipe.expire(self.HEARTBEAT_KEY, self.HEARTBEAT_TTL)
+        pipe.hset(f"worker:{worker_id}", 'last_active', now.strftime('%Y-%m-%d %H:%M:%S'))
+        pipe.execute()
 
-    def _save_stats_to_redis(self):
-        """将统计数据保存到Redis（按时间分片）"""
+    def _save_stats_to_redis(self, stats):
+        """将统计快照保存到Redis（按时间分片，所有写入通过一次pipeline提交）"""
         timestamp = datetime.now().strftime('%Y%m%d%H%M')
+        pipe = self.redis_conn.pipeline(transaction=False)
         # 保存总体统计
-        self.redis_conn.hset(f"stats:total:{timestamp}", mapping={
-            'total': self.stats['total_requests'],
-            'success': self.stats['success_requests'],
-            'failed': self.stats['failed_requests'],
-            'failure_rate': round(self.stats['failed_requests'] / max(self.stats['total_requests'], 1), 2)
+        pipe.hset(f"stats:total:{timestamp}", mapping={
+            'total': stats['total_requests'],
+            'success': stats['success_requests'],
+            'failed': stats['failed_requests'],
+            'failure_rate': round(stats['failed_requests'] / max(stats['total_requests'], 1), 2)
         })
         # 保存爬虫统计
-        for spider, data in self.stats['spider_stats'].items():
-            self.redis_conn.hset(f"stats:spider:{spider}:{timestamp}", mapping={
+        for spider, data in stats['spider_stats'].items():
+            pipe.hset(f"stats:spider:{spider}:{timestamp}", mapping={
                 'requests': data['requests'],
                 'success': data['success'],
                 'fail': data['fail'],
                 'failure_rate': round(data['fail'] / max(data['requests'], 1), 2)
             })
         # 保存Item统计
-        self.redis_conn.hset(f"stats:items:{timestamp}", mapping=self.stats['item_stats'])
+        pipe.hset(f"stats:items:{timestamp}", mapping=stats['item_stats'])
+        # 保存错误统计
+        if stats['error_stats']:
+            pipe.hset(f"stats:errors:{timestamp}", mapping=stats['error_stats'])
+        # 保存有更新的节点状态（同一节点多次更新只写最后一次）
+        for worker_id in stats['dirty_workers']:
+            node = stats['nodes'].get(worker_id)
+            if node:
+                pipe.hset(f"worker:{worker_id}", mapping={
+                    'last_active': datetime.fromtimestamp(node['last_active']).strftime('%Y-%m-%d %H:%M:%S'),
+                    'cpu_usage': node['cpu_usage'],
+                    'memory_usage': node['memory_usage']
+                })
+        pipe.execute()
 
-    def _check_alerts(self):
-        """检查告警条件并触发告警"""
+    def _check_alerts(self, stats):
+        """根据统计快照检查告警条件并触发告警"""
         current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         # 1. 失败率过高告警
-        total_fail_rate = self.stats['failed_requests'] / max(self.stats['total_requests'], 1)
+        total_fail_rate = stats['failed_requests'] / max(stats['total_requests'], 1)
         if total_fail_rate > self.alert_thresholds['failure_rate']:
             alert_msg = (f"[ALERT] 总体失败率过高: {total_fail_rate:.2%} "
-                        f"({self.stats['failed_requests']}/{self.stats['total_requests']}) "
+                        f"({stats['failed_requests']}/{stats['total_requests']}) "
                         f"at {current_time}")
             self._send_alert(alert_msg)
         
         # 2. 节点数量不足告警
-        active_nodes = len(self.stats['nodes'])
+        active_nodes = len(stats['nodes'])
         if active_nodes < self.alert_thresholds['min_working_nodes']:
             alert_msg = (f"[ALERT] 工作节点不足: 当前{active_nodes}个，"
                         f"最低要求{self.alert_thresholds['min_working_nodes']}个 "
                         f"at {current_time}")
             self._send_alert(alert_msg)
 
-    def _clean_expired_nodes(self):
-        """清理超过超时时间的离线节点"""
+    def _clean_expired_nodes(self, stats):
+        """根据统计快照清理超过超时时间的离线节点"""
         expired_ids = []
         now = time.time()
-        for worker_id, status in self.stats['nodes'].items():
+        for worker_id, status in stats['nodes'].items():
             if now - status['last_active'] > self.alert_thresholds['node_timeout']:
                 expired_ids.append(worker_id)
         
+        if not expired_ids:
+            return
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        pipe = self.redis_conn.pipeline(transaction=False)
+        pipe.srem('active_workers', *expired_ids)
+        for worker_id in expired_ids:
+            self.stats['nodes'].pop(worker_id, None)  # 不遍历共享字典，按键删除
+            pipe.hset(f"worker:{worker_id}", 'status', 'inactive')
+        pipe.execute()
         for worker_id in expired_ids:
-            del self.stats['nodes'][worker_id]
-            self.redis_conn.srem('active_workers', worker_id)
-            self.redis_conn.hset(f"worker:{worker_id}", 'status', 'inactive')
-            self._send_alert(f"[ALERT] 节点{worker_id}已离线 at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            self._send_alert(f"[ALERT] 节点{worker_id}已离线 at {current_time}")
 
     def _send_alert(self, message):
         """发送告警（可扩展为邮件/钉钉机器人）"""
@@ -160,7 +292,7 @@ class SpiderMonitor:
     def get_recent_stats(self, minutes=10):
         """获取最近N分钟的统计数据"""
         end_time = datetime.now()
-        start_time = end_time - datetime.timedelta(minutes=minutes)
+        start_time = end_time - timedelta(minutes=minutes)
         stats = []
         # 从Redis查询时间范围内的数据（简化实现）
         return stats
\ No newline at end of file
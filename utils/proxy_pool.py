@@ -1,38 +1,107 @@
 import time
+import atexit
 import random
 import threading
+import weakref
 import requests
 import logging
-from datetime import datetime
+from bisect import bisect_right
+from itertools import accumulate
+from operator import attrgetter
+from dataclasses import dataclass, field
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from scrapy.utils.project import get_project_settings
 
 logger = logging.getLogger(__name__)
 
+_score_of = attrgetter('score')
+
+# 进程内存活的ProxyPool实例，退出时统一停止检查线程（弱引用，不延长实例生命周期）
+_instances = weakref.WeakSet()
+
+
+@atexit.register
+def _close_all_pools():
+    for instance in list(_instances):
+        instance.close()
+
+
+@dataclass(slots=True)
+class ProxyEntry:
+    """代理池中的单个代理及其评分、熔断状态（slots避免每个代理一个属性字典）"""
+    proxy: str  # 代理URL，如 http://ip:port
+    score: int = 100
+    last_used: Optional[float] = None  # 最近一次分配时间（time.monotonic()）
+    fail_count: int = 0
+    success_count: int = 0
+    window_start: float = 0  # 熔断器当前失败计数窗口的起始时间
+    window_fails: int = 0  # 当前窗口内的失败次数
+    opened_at: float = 0  # 熔断时间，0表示熔断器关闭
+    probe_at: float = 0  # 半开状态下最近一次放行探测请求的时间
+    trips: int = 0  # 连续熔断次数（首次熔断计1，半开探测失败再次熔断时累加，关闭时清零）
+    idx: int = -1  # 在working_proxies中的下标，用于O(1)移除
+    proxies: dict = field(init=False, repr=False)  # 传给requests的代理映射，创建时构造一次后复用
+
+    def __post_init__(self):
+        self.proxies = {'http': self.proxy, 'https': self.proxy}
+
+
 class ProxyPool:
-    """代理池管理类，负责代理的加载、验证和动态维护"""
+    """代理池管理类，负责代理的加载、验证和动态维护
+
+    每个代理带一个熔断器：BREAKER_WINDOW秒内失败BREAKER_THRESHOLD次后熔断（打开），
+    BREAKER_RECOVERY秒内不再分配；恢复期过后放行一次请求作为探测（半开），
+    探测成功则关闭熔断器，失败则重新熔断；连续熔断超过BREAKER_MAX_TRIPS次的代理移出代理池。
+
+    加锁策略：self.lock只保护代理池结构（增删代理、复制快照）；单个代理的分数/熔断字段
+    由按URL哈希分片的LOCK_SHARDS把锁保护，不同代理的上报互不阻塞，选择代理时在锁外计算。
+    """
+    BREAKER_THRESHOLD = 5  # 窗口内失败次数阈值
+    BREAKER_WINDOW = 60  # 失败计数窗口（秒）
+    BREAKER_RECOVERY = 30  # 熔断后的恢复期（秒）
+    BREAKER_MAX_TRIPS = 3  # 连续熔断次数上限，超过后移除代理
+    CHECK_WORKERS = 32  # 代理并发验证的线程数（不超过Session连接池大小）
+    LOCK_SHARDS = 16  # 代理字段分片锁数量（2的幂）
+    CHECK_HEADERS = {  # 代理验证请求头（所有验证请求共用）
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36'
+    }
+    CHECK_OK_STATUS = frozenset((200, 302))  # 视为可用的验证响应状态码
+
     def __init__(self):
         self.settings = get_project_settings()
         self.proxy_list_path = self.settings.get('PROXY_LIST_PATH')
-        self.working_proxies = []  # 可用代理列表，格式: [{'proxy': 'http://ip:port', 'score': 100, 'last_used': None}, ...]
-        self.lock = threading.Lock()  # 线程锁
+        self.working_proxies = []  # 可用代理列表: [ProxyEntry, ...]
+        self._by_url = {}  # 代理URL到working_proxies中条目的索引，与列表同步增删
+        self.lock = threading.Lock()  # 代理池结构锁（增删代理）
+        self._shard_locks = [threading.Lock() for _ in range(self.LOCK_SHARDS)]  # 代理字段分片锁
+        # 代理验证复用同一个Session，按代理保持长连接，避免每次检查都重新握手
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0)  # 按代理缓存的连接池数与并发验证线程数一致
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.check_interval = self.settings.get('PROXY_CHECK_INTERVAL', 300)  # 代理检查间隔(秒)
         self.min_working_proxies = 3  # 最小可用代理数量
+        self._last_reload = 0  # 上次因代理不足重新加载文件的时间，check_interval内不重复加载
+        self._stop = threading.Event()  # 置位后检查线程退出
+        self._need_check = threading.Event()  # 代理不足时置位，提前唤醒检查线程
+        self._ready = threading.Event()  # 首轮验证完成后置位
         self.timeout = 10  # 代理验证超时时间
-        self.test_urls = [  # 用于验证代理的URL
+        self.test_urls = (  # 用于验证代理的URL
             'https://mobile.yangkeduo.com/',
             'https://www.taobao.com/',
             'https://www.jd.com/'
-        ]
+        )
         
-        # 初始化代理池
+        # 初始化代理池（未验证的代理按满分先行可用，失败由report_failure降分）
         self._load_proxies_from_file()
-        # 启动定期检查线程
+        # 启动定期检查线程，首轮即为初始验证，不阻塞构造
         self._start_check_thread()
-        # 初始验证
-        self._check_all_proxies()
 
     def _load_proxies_from_file(self):
-        """从文件加载代理列表"""
+        """从文件加载代理列表，返回本次新加入代理池的ProxyEntry列表"""
+        added = []
         try:
             with open(self.proxy_list_path, 'r') as f:
                 for line in f:
@@ -41,153 +110,267 @@ class ProxyPool:
                         # 确保代理格式正确
                         if not line.startswith(('http://', 'https://')):
                             line = f'http://{line}'
-                        self.working_proxies.append({
-                            'proxy': line,
-                            'score': 100,
-                            'last_used': None,
-                            'fail_count': 0,
-                            'success_count': 0
-                        })
-            logger.info(f"从文件加载代理 {len(self.working_proxies)} 个")
+                        with self.lock:
+                            # 文件内重复或已在池中（重新加载时）的代理跳过；在锁内判断，避免并发加载重复插入
+                            if line in self._by_url:
+                                continue
+                            entry = ProxyEntry(line, idx=len(self.working_proxies))
+                            self.working_proxies.append(entry)
+                            self._by_url[line] = entry
+                        added.append(entry)
+            logger.info(f"从文件加载代理 {len(added)} 个")
         except Exception as e:
             logger.error(f"加载代理列表失败: {e}")
+        return added
 
     def _start_check_thread(self):
         """启动定期检查代理的线程"""
         def check_loop():
-            while True:
+            while not self._stop.is_set():
                 self._check_all_proxies()
-                time.sleep(self.check_interval)
+                self._ready.set()
+                # 等待check_interval，期间代理不足或关闭时提前唤醒
+                self._need_check.wait(self.check_interval)
+                self._need_check.clear()
         
         thread = threading.Thread(target=check_loop, daemon=True)
         thread.start()
+        _instances.add(self)  # 进程退出前停止检查线程
         logger.info("代理定期检查线程已启动")
 
+    def wait_ready(self, timeout=None):
+        """等待首轮代理验证完成，返回是否在timeout秒内完成（需要已验证代理的调用方使用）"""
+        return self._ready.wait(timeout)
+
+    def close(self):
+        """停止定期检查线程并关闭验证用的Session"""
+        self._stop.set()
+        self._need_check.set()
+        self.session.close()
+
+    def _check_proxies(self, proxies):
+        """并发验证一批代理，返回[(ProxyEntry, 是否可用), ...]（网络等待相互重叠，总耗时约为单个超时）"""
+        if not proxies:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.CHECK_WORKERS, len(proxies))) as executor:
+            return list(zip(proxies, executor.map(self._check_proxy, proxies)))
+
     def _check_all_proxies(self):
-        """检查所有代理的可用性"""
+        """检查所有代理的可用性，代理不足时重新加载文件并只验证新加入的代理"""
         with self.lock:
-            proxies_to_check = self.working_proxies.copy()
+            proxies_to_check = self.working_proxies[:]
+        self._validate_proxies(proxies_to_check)
         
-        # 对每个代理进行验证
-        for proxy_info in proxies_to_check:
-            proxy = proxy_info['proxy']
-            is_working = self._check_proxy(proxy)
-            
-            with self.lock:
-                # 找到代理在列表中的位置
-                for p in self.working_proxies:
-                    if p['proxy'] == proxy:
-                        if is_working:
-                            # 验证成功，恢复分数
-                            p['score'] = min(p['score'] + 10, 100)
-                            p['success_count'] += 1
-                            p['fail_count'] = 0
-                            logger.debug(f"代理 {proxy} 验证成功，当前分数: {p['score']}")
-                        else:
-                            # 验证失败，降低分数
-                            p['score'] -= 20
-                            p['fail_count'] += 1
-                            logger.debug(f"代理 {proxy} 验证失败，当前分数: {p['score']}")
-                            
-                            # 分数过低则移除
-                            if p['score'] <= 0:
-                                self.working_proxies.remove(p)
-                                logger.warning(f"代理 {proxy} 分数过低，已移除")
-                        break
-        
-        # 如果可用代理不足，尝试重新加载
+        # 如果可用代理不足，尝试重新加载（check_interval内只加载一次，避免文件中代理普遍失效时反复加载）
         if len(self.working_proxies) < self.min_working_proxies:
+            now = time.time()
+            if now - self._last_reload < self.check_interval:
+                logger.warning(f"可用代理不足({len(self.working_proxies)}个)，距上次重新加载不足{self.check_interval}秒，跳过")
+                return
+            self._last_reload = now
             logger.warning(f"可用代理不足({len(self.working_proxies)}个)，尝试重新加载")
-            self._load_proxies_from_file()
-            # 再次检查
-            self._check_all_proxies()
+            self._validate_proxies(self._load_proxies_from_file())
+
+    def _validate_proxies(self, proxies):
+        """并发验证给定代理，结果在一次加锁中统一更新（移除延后到更新完成后统一处理）"""
+        results = self._check_proxies(proxies)
+        with self.lock:
+            to_remove = []
+            for p, is_working in results:
+                if self._by_url.get(p.proxy) is not p:
+                    continue  # 验证期间已被移除
+                with self._shard_lock(p.proxy):
+                    if not self._apply_check_result(p, is_working):
+                        to_remove.append(p)
+            for p in to_remove:
+                self._remove_proxy(p)
+                logger.warning(f"代理 {p.proxy} 分数过低，已移除")
 
-    def _check_proxy(self, proxy):
-        """检查单个代理是否可用"""
+    def _apply_check_result(self, p, is_working):
+        """根据验证结果更新代理分数（需持有该代理的分片锁），返回代理是否应保留"""
+        proxy = p.proxy
+        if is_working:
+            # 验证成功，恢复分数
+            p.score = min(p.score + 10, 100)
+            p.success_count += 1
+            self._close_breaker(p)
+            logger.debug("代理 %s 验证成功，当前分数: %s", proxy, p.score)
+            return True
+        # 验证失败，降低分数
+        p.score -= 20
+        p.fail_count += 1
+        logger.debug("代理 %s 验证失败，当前分数: %s", proxy, p.score)
+        # 分数过低则移除
+        return p.score > 0
+
+    def _check_proxy(self, p):
+        """检查单个代理是否可用（HEAD请求只取响应头，不下载首页HTML）"""
         try:
             test_url = random.choice(self.test_urls)
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36'
-            }
-            proxies = {
-                'http': proxy,
-                'https': proxy
-            }
-            
-            response = requests.get(
+            response = self.session.head(
                 test_url,
-                headers=headers,
-                proxies=proxies,
+                headers=self.CHECK_HEADERS,
+                proxies=p.proxies,
                 timeout=self.timeout,
                 allow_redirects=False
             )
+            if response.status_code == 405:
+                # 站点不支持HEAD时退回GET，stream=True只读取响应头，不读取响应体
+                with self.session.get(
+                    test_url,
+                    headers=self.CHECK_HEADERS,
+                    proxies=p.proxies,
+                    timeout=self.timeout,
+                    allow_redirects=False,
+                    stream=True
+                ) as response:
+                    return response.status_code in self.CHECK_OK_STATUS
             
             # 200或302状态码视为可用
-            return response.status_code in [200, 302]
+            return response.status_code in self.CHECK_OK_STATUS
         except Exception as e:
-            logger.debug(f"代理 {proxy} 验证失败: {e}")
+            logger.debug("代理 %s 验证失败: %s", p.proxy, e)
             return False
 
-    def get_working_proxy(self):
-        """获取一个可用代理（基于分数加权随机选择）"""
+    def _shard_lock(self, proxy):
+        """返回保护该代理字段的分片锁"""
+        return self._shard_locks[hash(proxy) & (self.LOCK_SHARDS - 1)]
+
+    def _remove_proxy(self, p):
+        """从代理池和索引中移除代理（需持有锁）：用末尾代理填补空位，O(1)移除"""
+        last = self.working_proxies.pop()
+        if last is not p:
+            self.working_proxies[p.idx] = last
+            last.idx = p.idx
+        del self._by_url[p.proxy]
+
+    def _is_available(self, p, now):
+        """熔断器关闭，或已过恢复期且当前没有进行中的探测时可分配"""
+        if not p.opened_at:
+            return True
+        return (now - p.opened_at >= self.BREAKER_RECOVERY
+                and now - p.probe_at >= self.BREAKER_RECOVERY)
+
+    def _close_breaker(self, p):
+        """关闭熔断器并清空失败窗口和失败计数"""
+        if p.opened_at:
+            logger.info(f"代理 {p.proxy} 探测成功，解除熔断")
+        p.opened_at = 0
+        p.probe_at = 0
+        p.window_fails = 0
+        p.trips = 0
+        p.fail_count = 0
+
+    def get_working_proxy(self, exclude=(), allow_probe=True):
+        """获取一个可用代理（跳过熔断中的代理，基于分数加权随机选择）
+
+        exclude: 不参与选择的代理URL集合（如调用方已持有的代理）
+        allow_probe: 为False时只选熔断器关闭的代理，不占用半开探测名额（用于预取，取出的代理不一定马上使用）
+        """
         with self.lock:
-            if not self.working_proxies:
-                logger.warning("没有可用代理，将使用本地IP")
-                return None
-            
-            # 基于分数加权随机选择（分数越高，被选中概率越大）
-            total_score = sum(p['score'] for p in self.working_proxies)
+            proxies = self.working_proxies[:]  # 只在复制快照时持有结构锁
+        if not proxies:
+            logger.warning("没有可用代理，将使用本地IP")
+            return None
+        
+        now = time.time()
+        candidates = [
+            p for p in proxies
+            if p.proxy not in exclude and (self._is_available(p, now) if allow_probe else not p.opened_at)
+        ]
+        while candidates:
+            # 基于分数加权随机选择（分数越高，被选中概率越大）：取分数和前缀和均在C层完成，再二分查找
+            cum_scores = list(accumulate(map(_score_of, candidates)))
+            total_score = cum_scores[-1]
             if total_score <= 0:
-                return random.choice(self.working_proxies)['proxy']
+                chosen = random.choice(candidates)
+            else:
+                chosen = candidates[bisect_right(cum_scores, random.random() * total_score)]
             
-            # 加权随机选择
-            rand = random.uniform(0, total_score)
-            current = 0
-            for p in self.working_proxies:
-                current += p['score']
-                if current >= rand:
-                    p['last_used'] = datetime.now()
-                    return p['proxy']
+            with self._shard_lock(chosen.proxy):
+                # 锁外选择期间半开探测可能已被其他线程占用，确认后再分配
+                if self._is_available(chosen, now):
+                    chosen.last_used = time.monotonic()
+                    if chosen.opened_at:
+                        chosen.probe_at = now  # 半开状态：本次请求作为探测
+                    return chosen.proxy
+            candidates.remove(chosen)
         
-        return random.choice(self.working_proxies)['proxy']
+        logger.warning("所有代理均处于熔断状态，将使用本地IP")
+        return None
+
+    def size(self):
+        """代理池中的代理数量（含熔断中的代理）"""
+        return len(self.working_proxies)
+
+    def is_usable(self, proxy):
+        """代理仍在池中且熔断器关闭（用于校验预取后暂存的代理是否已失效）"""
+        p = self._by_url.get(proxy)
+        return p is not None and not p.opened_at
 
     def report_failure(self, proxy):
         """报告代理使用失败"""
         if not proxy:
             return
             
-        with self.lock:
-            for p in self.working_proxies:
-                if p['proxy'] == proxy:
-                    p['fail_count'] += 1
-                    p['score'] = max(p['score'] - 15, 0)  # 失败一次扣15分
-                    logger.debug(f"代理 {proxy} 报告失败，当前分数: {p['score']}，失败次数: {p['fail_count']}")
-                    
-                    # 失败次数过多则标记为不可用
-                    if p['fail_count'] > 5:
-                        self.working_proxies.remove(p)
-                        logger.warning(f"代理 {proxy} 失败次数过多，已移除")
-                    break
+        p = self._by_url.get(proxy)
+        if p is None:
+            return
+        with self._shard_lock(proxy):
+            p.fail_count += 1
+            p.score = max(p.score - 15, 0)  # 失败一次扣15分
+            logger.debug("代理 %s 报告失败，当前分数: %s，失败次数: %s", proxy, p.score, p.fail_count)
+            
+            now = time.time()
+            if p.opened_at:
+                p.opened_at = now  # 熔断中再次失败，重新计时
+                if p.probe_at:
+                    # 半开探测失败，再次熔断
+                    p.probe_at = 0
+                    p.trips += 1
+                    logger.warning(f"代理 {proxy} 半开探测失败，第{p.trips}次熔断")
+            else:
+                if now - p.window_start > self.BREAKER_WINDOW:
+                    p.window_start = now
+                    p.window_fails = 0
+                p.window_fails += 1
+                if p.window_fails >= self.BREAKER_THRESHOLD:
+                    p.opened_at = now
+                    p.trips = 1
+                    logger.warning(f"代理 {proxy} {self.BREAKER_WINDOW}秒内失败{p.window_fails}次，熔断{self.BREAKER_RECOVERY}秒")
+            
+            remove = p.trips > self.BREAKER_MAX_TRIPS
+        
+        # 连续熔断次数过多则移除（移除需要结构锁，其他线程可能已先移除）
+        if remove:
+            with self.lock:
+                if self._by_url.get(proxy) is p:
+                    self._remove_proxy(p)
+                    logger.warning(f"代理 {proxy} 连续熔断{p.trips}次，已移除")
+                    if len(self.working_proxies) < self.min_working_proxies:
+                        self._need_check.set()  # 不等下一个周期，立即触发检查和补充
 
     def report_success(self, proxy):
         """报告代理使用成功"""
         if not proxy:
             return
             
-        with self.lock:
-            for p in self.working_proxies:
-                if p['proxy'] == proxy:
-                    p['success_count'] += 1
-                    p['score'] = min(p['score'] + 5, 100)  # 成功一次加5分
-                    logger.debug(f"代理 {proxy} 报告成功，当前分数: {p['score']}")
-                    break
+        p = self._by_url.get(proxy)
+        if p is None:
+            return
+        with self._shard_lock(proxy):
+            p.success_count += 1
+            p.score = min(p.score + 5, 100)  # 成功一次加5分
+            self._close_breaker(p)
+            logger.debug("代理 %s 报告成功，当前分数: %s", proxy, p.score)
 
     def get_stats(self):
         """获取代理池统计信息"""
         with self.lock:
-            return {
-                'total': len(self.working_proxies),
-                'working': len([p for p in self.working_proxies if p['score'] > 0]),
-                'average_score': sum(p['score'] for p in self.working_proxies) / max(len(self.working_proxies), 1),
-                'top_proxies': [p['proxy'] for p in sorted(self.working_proxies, key=lambda x: x['score'], reverse=True)[:3]]
-            }
\ No newline at end of file
+            proxies = self.working_proxies[:]
+        return {
+            'total': len(proxies),
+            'working': len([p for p in proxies if p.score > 0]),
+            'average_score': sum(p.score for p in proxies) / max(len(proxies), 1),
+            'top_proxies': [p.proxy for p in sorted(proxies, key=lambda x: x.score, reverse=True)[:3]]
+        }
\ No newline at end of file